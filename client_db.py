@@ -0,0 +1,117 @@
+import os
+import sqlite3
+
+# Колонки, которые использует клиентское приложение
+CLIENT_COLUMNS = {
+    'movies': ['id', 'title', 'original_title', 'overview', 'rating', 'release_date', 'poster_url',
+               'genres', 'countries', 'directors', 'actors', 'media_type',
+               'torrent_count', 'max_seeds', 'max_quality', 'last_torrent_at'],
+    'torrents': ['id', 'tracker', 'topic_id', 'movie_id', 'topic_title', 'size_gb', 'quality',
+                 'file_format', 'translation', 'magnet_link', 'seeds', 'leeches'],
+    'now_playing': ['movie_id', 'added_at'],
+}
+
+# Откуда берутся строки клиентских таблиц в базе парсера. Жанры, страны и люди хранятся в справочниках,
+# строки 'имя, имя' для клиентов собирает представление movies_export (см. database.NAME_LISTS);
+# torrents_export отдает одну строку на info hash с лучшими сидами по всем трекерам и без мертвых раздач;
+# полная база и дельты читают одни и те же источники, поэтому видят одинаковый набор строк
+CLIENT_SOURCES = {
+    'movies': 'movies_export',
+    'torrents': 'torrents_export',
+    'now_playing': 'now_playing',
+}
+
+CLIENT_SCHEMA = """
+CREATE TABLE movies (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    original_title TEXT,
+    overview TEXT,
+    rating REAL,
+    release_date TEXT,
+    poster_url TEXT,
+    genres TEXT,
+    countries TEXT,
+    directors TEXT,
+    actors TEXT,
+    media_type TEXT DEFAULT 'movie',
+    torrent_count INTEGER DEFAULT 0,
+    max_seeds INTEGER DEFAULT 0,
+    max_quality TEXT,
+    last_torrent_at TIMESTAMP
+);
+CREATE TABLE torrents (
+    id INTEGER PRIMARY KEY,
+    tracker TEXT,
+    topic_id INTEGER,
+    movie_id INTEGER,
+    topic_title TEXT,
+    size_gb REAL,
+    quality TEXT,
+    file_format TEXT,
+    translation TEXT,
+    magnet_link TEXT,
+    seeds INTEGER,
+    leeches INTEGER
+);
+CREATE TABLE now_playing (
+    movie_id INTEGER PRIMARY KEY,
+    added_at TIMESTAMP
+);
+"""
+
+# Индексы под запросы клиента: списки по типу и дате/рейтингу/сидам, раздачи фильма по сидам
+CLIENT_INDEXES = """
+CREATE INDEX idx_movies_type_date ON movies(media_type, release_date DESC);
+CREATE INDEX idx_movies_type_rating ON movies(media_type, rating DESC);
+CREATE INDEX idx_movies_type_seeds ON movies(media_type, max_seeds DESC) WHERE torrent_count > 0;
+CREATE INDEX idx_movies_release_date ON movies(release_date);
+CREATE INDEX idx_torrents_movie_seeds ON torrents(movie_id, seeds DESC, size_gb, quality);
+"""
+
+CLIENT_PAGE_SIZE = 4096
+
+
+def build_client_db(src_path, dest_path, media_type=None):
+    """
+    Собирает из базы парсера отдельную компактную базу для клиентов: только нужные колонки
+    и строки CLIENT_SOURCES, без осиротевших раздач, с готовыми индексами, после VACUUM.
+    media_type ('movie' или 'tv') собирает шард только с фильмами или сериалами.
+    """
+    if os.path.exists(dest_path):
+        os.remove(dest_path)
+
+    conn = sqlite3.connect(dest_path)
+    try:
+        conn.execute(f"PRAGMA page_size = {CLIENT_PAGE_SIZE}")
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.executescript(CLIENT_SCHEMA)
+        conn.execute("ATTACH DATABASE ? AS src", (src_path,))
+
+        movie_filter = "WHERE media_type = ?" if media_type else ""
+        params = (media_type,) if media_type else ()
+        movie_cols = ", ".join(CLIENT_COLUMNS['movies'])
+        conn.execute(f"INSERT INTO movies ({movie_cols}) SELECT {movie_cols} FROM src.{CLIENT_SOURCES['movies']} {movie_filter} ORDER BY id", params)
+
+        torrent_cols = ", ".join(CLIENT_COLUMNS['torrents'])
+        conn.execute(f"""
+            INSERT INTO torrents ({torrent_cols})
+            SELECT {", ".join('t.' + c for c in CLIENT_COLUMNS['torrents'])}
+            FROM src.{CLIENT_SOURCES['torrents']} t JOIN movies m ON m.id = t.movie_id
+            ORDER BY t.movie_id, t.seeds DESC
+        """)
+        conn.execute("""
+            INSERT INTO now_playing (movie_id, added_at)
+            SELECT np.movie_id, np.added_at FROM src.now_playing np JOIN movies m ON m.id = np.movie_id
+        """)
+        conn.commit()
+        conn.execute("DETACH DATABASE src")
+
+        conn.executescript(CLIENT_INDEXES)
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return dest_path
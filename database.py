@@ -1,15 +1,105 @@
 import sqlite3
 import threading
+import hashlib
+import json
+from metrics import DB_DURATION, timed
+from profiler import profiled
+from client_db import CLIENT_COLUMNS
+from release_parser import parse_info_hash
 
 db_lock = threading.Lock()
+
+# Списки имен фильма хранятся в справочниках со связующими таблицами, а не строками в movies.
+# Колонка -> (позиция в кортеже upsert_movie, справочник, связь, ключ справочника, роль)
+NAME_LISTS = {
+    'genres': (7, 'genres', 'movie_genres', 'genre_id', None),
+    'countries': (8, 'countries', 'movie_countries', 'country_id', None),
+    'directors': (9, 'people', 'movie_people', 'person_id', 'director'),
+    'actors': (10, 'people', 'movie_people', 'person_id', 'actor'),
+}
+# Справочники, которые целиком держим в памяти (людей слишком много)
+CACHED_LOOKUPS = ('genres', 'countries')
+
+def split_names(value):
+    """'Драма, Комедия' -> ['Драма', 'Комедия'] без пустых и повторов."""
+    if not value:
+        return []
+    return list(dict.fromkeys(name.strip() for name in value.split(', ') if name.strip()))
+
+def _name_list_sql(column, movie_id_expr):
+    """Строка 'имя, имя' для колонки column, собранная из справочника в исходном порядке."""
+    _, lookup, link, key, role = NAME_LISTS[column]
+    role_filter = f" AND l.role = '{role}'" if role else ""
+    return (f"(SELECT group_concat(name, ', ') FROM (SELECT n.name FROM {link} l JOIN {lookup} n ON n.id = l.{key} "
+            f"WHERE l.movie_id = {movie_id_expr}{role_filter} ORDER BY l.position))")
+
+# Строки movies в том виде, в каком их получают клиенты (выгрузка, дельты, API)
+MOVIES_EXPORT_VIEW = "CREATE VIEW movies_export AS SELECT " + ", ".join(
+    f"{_name_list_sql(col, 'movies.id')} AS {col}" if col in NAME_LISTS else col
+    for col in CLIENT_COLUMNS['movies']
+) + " FROM movies"
+
+# Одна и та же раздача (один info hash) на нескольких трекерах: первая строка основная, у остальных
+# canonical_id указывает на нее. Клиенты получают только основные строки, сиды и личи - лучшие по всем копиям.
+def _merged_peers_sql(column, alias='torrents'):
+    return (f"CASE WHEN {alias}.info_hash IS NULL THEN {alias}.{column} ELSE "
+            f"(SELECT MAX(d.{column}) FROM torrents d WHERE d.info_hash = {alias}.info_hash) END")
+
+# Мертвые раздачи (0 сидов по всем копиям) клиентам не выгружаются - ни в полной базе, ни в дельтах
+TORRENTS_EXPORT_VIEW = "CREATE VIEW torrents_export AS SELECT " + ", ".join(CLIENT_COLUMNS['torrents']) + " FROM (SELECT " + ", ".join(
+    f"{_merged_peers_sql(col)} AS {col}" if col in ('seeds', 'leeches') else col
+    for col in CLIENT_COLUMNS['torrents']
+) + " FROM torrents WHERE canonical_id IS NULL) WHERE seeds > 0"
+
+def _torrent_aggregates_sql(movie_ids_expr, extra=""):
+    """
+    Пересчет сводки по раздачам фильмов movie_ids_expr (число, лучшие сиды, качество самой большой раздачи).
+    Считается по строкам torrents_export, то есть ровно по тем раздачам, которые получают клиенты.
+    """
+    return f"""
+    UPDATE movies SET {extra}
+        torrent_count = (SELECT COUNT(*) FROM torrents_export e WHERE e.movie_id = movies.id),
+        max_seeds = (SELECT COALESCE(MAX(e.seeds), 0) FROM torrents_export e WHERE e.movie_id = movies.id),
+        max_quality = (SELECT e.quality FROM torrents_export e WHERE e.movie_id = movies.id ORDER BY e.size_gb DESC LIMIT 1)
+    WHERE id IN ({movie_ids_expr});
+    """
+
+# Сиды копии влияют на сводку фильма основной строки, который может отличаться от фильма копии
+def _affected_movies_sql(row):
+    return f"{row}.movie_id, (SELECT c.movie_id FROM torrents c WHERE c.id = {row}.canonical_id)"
+
+def _ensure_view(conn, name, create_sql):
+    """Создает представление или пересоздает его, если определение изменилось."""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = ?", (name,)).fetchone()
+    if row is None or row[0] != create_sql:
+        conn.execute(f"DROP VIEW IF EXISTS {name}")
+        conn.execute(create_sql)
+        conn.commit()
+
+def _drop_outdated_trigger(conn, name, marker):
+    """
+    Триггеры создаются через IF NOT EXISTS: старое определение (без marker) удаляем, чтобы создать заново.
+    Возвращает True, если триггер был удален.
+    """
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()
+    if row and marker not in row[0]:
+        conn.execute(f"DROP TRIGGER {name}")
+        return True
+    return False
+
 class MovieDatabase:
     def __init__(self, db_name="data/movies.db"):
         self.db_name = db_name
+        # Нечеткий индекс названий (title_index.TitleIndex), подключается на этапе трекеров
+        self.title_index = None
+        # Имя -> id для небольших справочников (CACHED_LOOKUPS)
+        self._name_ids = {lookup: {} for lookup in CACHED_LOOKUPS}
         self._create_tables()
         self._run_migrations()
 
     def get_connection(self):
-        return sqlite3.connect(self.db_name)
+        # Писатели (воркеры менеджера задач) по-прежнему сериализуются на блокировке записи - ждем ее дольше стандартных 5 с
+        return sqlite3.connect(self.db_name, timeout=30)
 
     def _create_tables(self):
         """Создает таблицы, если они еще не существуют."""
@@ -26,7 +116,14 @@ class MovieDatabase:
             countries TEXT,
             directors TEXT,
             actors TEXT,
-            media_type TEXT DEFAULT 'movie'
+            media_type TEXT DEFAULT 'movie',
+            content_hash TEXT,
+            updated_at TIMESTAMP,
+            version INTEGER DEFAULT 0,
+            torrent_count INTEGER DEFAULT 0,
+            max_seeds INTEGER DEFAULT 0,
+            max_quality TEXT,
+            last_torrent_at TIMESTAMP
         )
         """
         
@@ -44,6 +141,8 @@ class MovieDatabase:
             magnet_link TEXT,
             seeds INTEGER,
             leeches INTEGER,
+            info_hash TEXT,
+            canonical_id INTEGER,
             UNIQUE(tracker, topic_id),
             FOREIGN KEY(movie_id) REFERENCES movies(id)
         )
@@ -55,10 +154,53 @@ class MovieDatabase:
             FOREIGN KEY(movie_id) REFERENCES movies(id)
         )
         """
+        crawl_state_query = """
+        CREATE TABLE IF NOT EXISTS forum_crawl_state (
+            tracker TEXT,
+            forum_id INTEGER,
+            max_topic_id INTEGER DEFAULT 0,
+            last_crawl_at REAL,
+            topics_per_hour REAL DEFAULT 0,
+            PRIMARY KEY(tracker, forum_id)
+        )
+        """
+        # Журнал изменений для инкрементальной выгрузки клиентам (seq - номер версии)
+        change_log_query = """
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT,
+            row_id INTEGER,
+            op TEXT
+        )
+        """
+        # Справочники и связи для жанров, стран и людей (position - порядок в исходном списке)
+        names_query = """
+        CREATE TABLE IF NOT EXISTS genres (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS countries (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS people (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS movie_genres (
+            movie_id INTEGER, position INTEGER, genre_id INTEGER,
+            PRIMARY KEY(movie_id, position)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS movie_countries (
+            movie_id INTEGER, position INTEGER, country_id INTEGER,
+            PRIMARY KEY(movie_id, position)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS movie_people (
+            movie_id INTEGER, role TEXT, position INTEGER, person_id INTEGER,
+            PRIMARY KEY(movie_id, role, position)
+        ) WITHOUT ROWID;
+        """
         with self.get_connection() as conn:
+            # Пишут несколько процессов (воркеры менеджера задач, запуск из консоли), читает пул web_app:
+            # в WAL читатели не блокируют запись и видят последний закоммиченный срез. Режим хранится в файле БД.
+            conn.execute("PRAGMA journal_mode = WAL")
             conn.execute(movies_query)
             conn.execute(torrents_query)
             conn.execute(now_playing_query)
+            conn.execute(crawl_state_query)
+            conn.execute(change_log_query)
+            conn.executescript(names_query)
             conn.commit()
 
     def _run_migrations(self):
@@ -70,6 +212,22 @@ class MovieDatabase:
                     conn.execute("ALTER TABLE movies ADD COLUMN media_type TEXT DEFAULT 'movie'")
                     conn.commit()
 
+                # Хеш содержимого и версия строки, чтобы не перезаписывать неизменившиеся фильмы
+                if 'content_hash' not in columns:
+                    conn.execute("ALTER TABLE movies ADD COLUMN content_hash TEXT")
+                    conn.execute("ALTER TABLE movies ADD COLUMN updated_at TIMESTAMP")
+                    conn.execute("ALTER TABLE movies ADD COLUMN version INTEGER DEFAULT 0")
+                    conn.commit()
+
+                # Сводка по раздачам прямо в movies: списки и сортировка по сидам без join с torrents
+                backfill_aggregates = 'torrent_count' not in columns
+                if backfill_aggregates:
+                    conn.execute("ALTER TABLE movies ADD COLUMN torrent_count INTEGER DEFAULT 0")
+                    conn.execute("ALTER TABLE movies ADD COLUMN max_seeds INTEGER DEFAULT 0")
+                    conn.execute("ALTER TABLE movies ADD COLUMN max_quality TEXT")
+                    conn.execute("ALTER TABLE movies ADD COLUMN last_torrent_at TIMESTAMP")
+                    conn.commit()
+
                 # Migration for torrents table to add tracker
                 cursor = conn.execute("PRAGMA table_info(torrents)")
                 columns = [info[1] for info in cursor.fetchall()]
@@ -77,16 +235,202 @@ class MovieDatabase:
                     conn.execute("DROP TABLE torrents")
                     conn.commit()
                     self._create_tables()
+                    columns = ['tracker', 'info_hash']
+
+                # Info hash раздачи для склейки одинаковых раздач с разных трекеров
+                backfill_hashes = 'info_hash' not in columns
+                if backfill_hashes:
+                    conn.execute("ALTER TABLE torrents ADD COLUMN info_hash TEXT")
+                    conn.execute("ALTER TABLE torrents ADD COLUMN canonical_id INTEGER")
+                    conn.commit()
 
                 # Безопасное создание индексов для ускорения поиска на клиенте
                 indexes_query = """
                 CREATE INDEX IF NOT EXISTS idx_movies_release_date ON movies(release_date);
-                CREATE INDEX IF NOT EXISTS idx_torrents_movie_id ON torrents(movie_id);
                 CREATE INDEX IF NOT EXISTS idx_movies_media_type ON movies(media_type);
+                CREATE INDEX IF NOT EXISTS idx_movies_updated_at ON movies(updated_at);
+                CREATE INDEX IF NOT EXISTS idx_movies_torrent_count ON movies(torrent_count);
+                CREATE INDEX IF NOT EXISTS idx_movies_seeds ON movies(max_seeds DESC, id DESC) WHERE torrent_count > 0;
+                CREATE INDEX IF NOT EXISTS idx_movies_type_seeds ON movies(media_type, max_seeds DESC, id DESC) WHERE torrent_count > 0;
+                -- Раздачи фильма по сидам (API, сводка max_seeds) и по размеру (страница фильма, max_quality);
+                -- оба индекса начинаются с movie_id, отдельный индекс по movie_id не нужен
+                CREATE INDEX IF NOT EXISTS idx_torrents_movie_seeds ON torrents(movie_id, seeds DESC, size_gb DESC);
+                CREATE INDEX IF NOT EXISTS idx_torrents_movie_size ON torrents(movie_id, size_gb DESC);
+                DROP INDEX IF EXISTS idx_torrents_movie_id;
+                -- Фильтры каталога: по жанру, стране, человеку, рейтингу
+                CREATE INDEX IF NOT EXISTS idx_movie_genres_genre ON movie_genres(genre_id, movie_id);
+                CREATE INDEX IF NOT EXISTS idx_movie_countries_country ON movie_countries(country_id, movie_id);
+                CREATE INDEX IF NOT EXISTS idx_movie_people_person ON movie_people(person_id, role, movie_id);
+                CREATE INDEX IF NOT EXISTS idx_movies_rating ON movies(rating);
+                CREATE INDEX IF NOT EXISTS idx_torrents_info_hash ON torrents(info_hash) WHERE info_hash IS NOT NULL;
                 """
                 conn.executescript(indexes_query)
                 conn.commit()
 
+                # Триггеры журнала изменений: строки movies, torrents и now_playing
+                torrent_changed = " OR ".join(
+                    f"OLD.{col} IS NOT NEW.{col}" for col in (
+                        'movie_id', 'topic_title', 'size_gb', 'quality', 'file_format',
+                        'translation', 'magnet_link', 'seeds', 'leeches'
+                    )
+                )
+                # Строка фильма попадает в журнал, только если изменилось содержимое (списки имен
+                # хранятся в справочниках, их изменение видно по content_hash) или сводка по раздачам
+                movie_changed = " OR ".join(
+                    f"OLD.{col} IS NOT NEW.{col}" for col in ['content_hash'] + CLIENT_COLUMNS['movies']
+                    if col != 'id' and col not in NAME_LISTS
+                )
+                _drop_outdated_trigger(conn, 'trg_movies_update', movie_changed)
+                # Изменения копии раздачи попадают в журнал как изменения основной строки (ее сиды - лучшие по копиям)
+                for name in ('trg_torrents_insert', 'trg_torrents_update'):
+                    _drop_outdated_trigger(conn, name, 'canonical_id')
+                # Старые триггеры сводки считали и раздачи, которых нет у клиентов (копии, 0 сидов),
+                # после их замены сводку пересчитываем
+                recompute_aggregates = any([
+                    _drop_outdated_trigger(conn, name, 'torrents_export')
+                    for name in ('trg_torrents_aggregates_insert', 'trg_torrents_aggregates_update',
+                                 'trg_torrents_aggregates_move', 'trg_torrents_aggregates_delete')
+                ])
+                triggers_query = f"""
+                CREATE TRIGGER IF NOT EXISTS trg_movies_insert AFTER INSERT ON movies BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('movies', NEW.id, 'upsert');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_movies_update AFTER UPDATE ON movies WHEN {movie_changed} BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('movies', NEW.id, 'upsert');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_movies_delete AFTER DELETE ON movies BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('movies', OLD.id, 'delete');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_torrents_insert AFTER INSERT ON torrents BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('torrents', COALESCE(NEW.canonical_id, NEW.id), 'upsert');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_torrents_update AFTER UPDATE ON torrents WHEN {torrent_changed} BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('torrents', COALESCE(NEW.canonical_id, NEW.id), 'upsert');
+                END;
+                -- Строка стала копией: у клиентов она удаляется, основная обновляется
+                CREATE TRIGGER IF NOT EXISTS trg_torrents_merge AFTER UPDATE OF canonical_id ON torrents
+                WHEN OLD.canonical_id IS NULL AND NEW.canonical_id IS NOT NULL BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('torrents', NEW.id, 'delete');
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('torrents', NEW.canonical_id, 'upsert');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_torrents_delete AFTER DELETE ON torrents BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('torrents', OLD.id, 'delete');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_now_playing_insert AFTER INSERT ON now_playing BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('now_playing', NEW.movie_id, 'upsert');
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_now_playing_delete AFTER DELETE ON now_playing BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('now_playing', OLD.movie_id, 'delete');
+                END;
+
+                -- Сводка по раздачам в movies: любые пути записи (вставка, сиды, массовое обновление, разбор)
+                CREATE TRIGGER IF NOT EXISTS trg_torrents_aggregates_insert AFTER INSERT ON torrents BEGIN
+                    {_torrent_aggregates_sql(_affected_movies_sql('NEW'), extra='last_torrent_at = CURRENT_TIMESTAMP,')}
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_torrents_aggregates_update AFTER UPDATE ON torrents
+                WHEN OLD.movie_id IS NOT NEW.movie_id OR OLD.seeds IS NOT NEW.seeds OR OLD.size_gb IS NOT NEW.size_gb
+                    OR OLD.quality IS NOT NEW.quality OR OLD.canonical_id IS NOT NEW.canonical_id BEGIN
+                    {_torrent_aggregates_sql(_affected_movies_sql('NEW'))}
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_torrents_aggregates_move AFTER UPDATE ON torrents
+                WHEN OLD.movie_id IS NOT NEW.movie_id BEGIN
+                    {_torrent_aggregates_sql(_affected_movies_sql('OLD'))}
+                END;
+                CREATE TRIGGER IF NOT EXISTS trg_torrents_aggregates_delete AFTER DELETE ON torrents BEGIN
+                    {_torrent_aggregates_sql(_affected_movies_sql('OLD'))}
+                END;
+                """
+                conn.executescript(triggers_query)
+                conn.commit()
+
+                _ensure_view(conn, 'movies_export', MOVIES_EXPORT_VIEW)
+                _ensure_view(conn, 'torrents_export', TORRENTS_EXPORT_VIEW)
+
+                self._migrate_name_lists(conn)
+                if backfill_hashes:
+                    self._merge_duplicate_torrents(conn)
+
+                if backfill_aggregates or recompute_aggregates:
+                    # Времени добавления у старых раздач нет: last_torrent_at заполняем моментом миграции
+                    # (приближение - раздачи появились не позже него)
+                    extra = "last_torrent_at = CURRENT_TIMESTAMP," if backfill_aggregates else ""
+                    conn.execute(_torrent_aggregates_sql("SELECT DISTINCT movie_id FROM torrents", extra=extra))
+                    conn.commit()
+
+    def _merge_duplicate_torrents(self, conn):
+        """Заполняет info_hash у существующих раздач и помечает копии (основная - самая ранняя строка)."""
+        rows = conn.execute("SELECT id, magnet_link FROM torrents WHERE magnet_link IS NOT NULL AND magnet_link != ''").fetchall()
+        hashes = [(info_hash, torrent_id) for torrent_id, info_hash in
+                  ((torrent_id, parse_info_hash(magnet)) for torrent_id, magnet in rows) if info_hash]
+        conn.executemany("UPDATE torrents SET info_hash = ? WHERE id = ?", hashes)
+        conn.execute("""
+            UPDATE torrents SET canonical_id = (SELECT MIN(d.id) FROM torrents d WHERE d.info_hash = torrents.info_hash)
+            WHERE info_hash IS NOT NULL AND canonical_id IS NULL
+              AND id > (SELECT MIN(d.id) FROM torrents d WHERE d.info_hash = torrents.info_hash)
+        """)
+        conn.commit()
+
+    def _migrate_name_lists(self, conn, batch_size=5000):
+        """
+        Переносит строки жанров, стран и людей из старых строк movies в справочники и обнуляет их.
+        Идет пачками с коммитом после каждой, поэтому прерванный перенос продолжится при следующем запуске.
+        """
+        legacy = " OR ".join(f"{col} IS NOT NULL" for col in NAME_LISTS)
+        last_id = -1
+        while True:
+            rows = conn.execute(
+                f"SELECT id, {', '.join(NAME_LISTS)} FROM movies WHERE id > ? AND ({legacy}) ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                self._write_names(conn, row[0], dict(zip(NAME_LISTS, row[1:])))
+            conn.executemany(
+                f"UPDATE movies SET {', '.join(f'{col} = NULL' for col in NAME_LISTS)} WHERE id = ?",
+                [(row[0],) for row in rows]
+            )
+            conn.commit()
+            last_id = rows[-1][0]
+
+    def _lookup_ids(self, conn, lookup, names):
+        """id записей справочника lookup для имен names; недостающие добавляются."""
+        cache = self._name_ids.get(lookup)
+        ids = []
+        for name in names:
+            name_id = cache.get(name) if cache is not None else None
+            if name_id is None:
+                row = conn.execute(f"SELECT id FROM {lookup} WHERE name = ?", (name,)).fetchone()
+                if row is None:
+                    conn.execute(f"INSERT OR IGNORE INTO {lookup} (name) VALUES (?)", (name,))
+                    row = conn.execute(f"SELECT id FROM {lookup} WHERE name = ?", (name,)).fetchone()
+                name_id = row[0]
+                if cache is not None:
+                    cache[name] = name_id
+            ids.append(name_id)
+        return ids
+
+    def _write_names(self, conn, movie_id, values):
+        """Заменяет связи фильма со справочниками. values - {колонка из NAME_LISTS: 'имя, имя'}."""
+        for link in {spec[2] for spec in NAME_LISTS.values()}:
+            conn.execute(f"DELETE FROM {link} WHERE movie_id = ?", (movie_id,))
+        for column, (_, lookup, link, key, role) in NAME_LISTS.items():
+            names = split_names(values.get(column))
+            if not names:
+                continue
+            ids = self._lookup_ids(conn, lookup, names)
+            if role:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {link} (movie_id, role, position, {key}) VALUES (?, ?, ?, ?)",
+                    [(movie_id, role, position, name_id) for position, name_id in enumerate(ids)]
+                )
+            else:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {link} (movie_id, position, {key}) VALUES (?, ?, ?)",
+                    [(movie_id, position, name_id) for position, name_id in enumerate(ids)]
+                )
+
+    @timed(DB_DURATION, operation='get_existing_ids')
     def get_existing_ids(self):
         """Возвращает множество ID фильмов, которые уже есть в базе."""
         query = "SELECT id FROM movies"
@@ -116,40 +460,118 @@ class MovieDatabase:
             except sqlite3.OperationalError:
                 return None
 
+    @staticmethod
+    def movie_content_hash(movie_data):
+        return hashlib.sha1(json.dumps(list(movie_data), ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    @timed(DB_DURATION, operation='upsert_movie')
+    @profiled('db: upsert_movie')
     def upsert_movie(self, movie_data):
         """
         Вставляет или обновляет данные о фильме.
-        movie_data ожидает кортеж: (id, title, original_title, overview, rating, release_date, poster_url, genres, countries, directors, actors)
+        movie_data ожидает кортеж: (id, title, original_title, overview, rating, release_date, poster_url, genres, countries, directors, actors, media_type)
+        Если хеш содержимого не изменился, запись не трогается. Возвращает True, если строка была записана.
+        Жанры, страны, режиссеры и актеры записываются в справочники (NAME_LISTS), в movies эти колонки пустые.
         """
-        query = """
-        INSERT OR REPLACE INTO movies (
+        insert_query = """
+        INSERT INTO movies (
             id, title, original_title, overview, rating, release_date, poster_url,
-            genres, countries, directors, actors, media_type
+            genres, countries, directors, actors, media_type, content_hash, updated_at, version
         )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, 1)
         """
+        update_query = """
+        UPDATE movies SET
+            title = ?, original_title = ?, overview = ?, rating = ?, release_date = ?, poster_url = ?,
+            genres = ?, countries = ?, directors = ?, actors = ?, media_type = ?,
+            content_hash = ?, updated_at = CURRENT_TIMESTAMP, version = COALESCE(version, 0) + 1
+        WHERE id = ?
+        """
+        content_hash = self.movie_content_hash(movie_data)
+        names = {column: movie_data[spec[0]] for column, spec in NAME_LISTS.items()}
+        stored = list(movie_data)
+        for spec in NAME_LISTS.values():
+            stored[spec[0]] = None
         with db_lock:
             with self.get_connection() as conn:
-                conn.execute(query, movie_data)
+                row = conn.execute("SELECT content_hash FROM movies WHERE id = ?", (movie_data[0],)).fetchone()
+                if row is None:
+                    conn.execute(insert_query, tuple(stored) + (content_hash,))
+                elif row[0] == content_hash:
+                    return False
+                else:
+                    conn.execute(update_query, tuple(stored[1:]) + (content_hash, movie_data[0]))
+                self._write_names(conn, movie_data[0], names)
                 conn.commit()
+        if self.title_index is not None:
+            self.title_index.add(movie_data[0], movie_data[1], movie_data[2], movie_data[5], movie_data[11])
+        return True
+
+    def iter_titles_for_index(self, updated_since=None):
+        """
+        Отдает (id, title, original_title, release_date, media_type) фильмов с датой выхода;
+        с updated_since - только записанных не раньше этого момента (см. current_timestamp).
+        """
+        query = "SELECT id, title, original_title, release_date, media_type FROM movies WHERE release_date IS NOT NULL AND release_date != ''"
+        params = ()
+        if updated_since:
+            query += " AND updated_at >= ?"
+            params = (updated_since,)
+        with self.get_connection() as conn:
+            yield from conn.execute(query, params)
+
+    def current_timestamp(self):
+        """CURRENT_TIMESTAMP базы - в том же формате, что и movies.updated_at."""
+        with self.get_connection() as conn:
+            return conn.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
 
+    @timed(DB_DURATION, operation='insert_torrent')
+    @profiled('db: insert_torrent')
     def insert_torrent(self, tracker, topic_id, movie_id, topic_title, size_gb, quality, file_format, translation, magnet_link, seeds, leeches):
+        """Добавляет раздачу. Если раздача с тем же info hash уже есть (обычно с другого трекера), новая строка - ее копия."""
         query = """
         INSERT OR IGNORE INTO torrents (
-            tracker, topic_id, movie_id, topic_title, size_gb, quality, file_format, translation, magnet_link, seeds, leeches
+            tracker, topic_id, movie_id, topic_title, size_gb, quality, file_format, translation, magnet_link, seeds, leeches,
+            info_hash, canonical_id
         )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
+        info_hash = parse_info_hash(magnet_link)
         with db_lock:
             with self.get_connection() as conn:
-                conn.execute(query, (tracker, topic_id, movie_id, topic_title, size_gb, quality, file_format, translation, magnet_link, seeds, leeches))
+                canonical_id = None
+                if info_hash:
+                    row = conn.execute(
+                        "SELECT COALESCE(canonical_id, id) FROM torrents WHERE info_hash = ? AND NOT (tracker = ? AND topic_id = ?) LIMIT 1",
+                        (info_hash, tracker, topic_id)
+                    ).fetchone()
+                    canonical_id = row[0] if row else None
+                conn.execute(query, (tracker, topic_id, movie_id, topic_title, size_gb, quality, file_format, translation, magnet_link,
+                                     seeds, leeches, info_hash, canonical_id))
                 conn.commit()
 
+    @timed(DB_DURATION, operation='find_torrent_by_hash')
+    def find_torrent_by_hash(self, info_hash):
+        """Основная раздача с этим info hash: {'id', 'movie_id', 'size_gb', 'quality', 'translation'} или None."""
+        query = """
+        SELECT id, movie_id, size_gb, quality, translation FROM torrents
+        WHERE info_hash = ? AND canonical_id IS NULL LIMIT 1
+        """
+        with self.get_connection() as conn:
+            row = conn.execute(query, (info_hash,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'movie_id', 'size_gb', 'quality', 'translation'), row))
+
+    @timed(DB_DURATION, operation='is_torrent_exists')
+    @profiled('db: is_torrent_exists')
     def is_torrent_exists(self, tracker, topic_id):
         query = "SELECT 1 FROM torrents WHERE tracker = ? AND topic_id = ?"
         with self.get_connection() as conn:
             return conn.execute(query, (tracker, topic_id)).fetchone() is not None
 
+    @timed(DB_DURATION, operation='update_torrent_seeds')
+    @profiled('db: update_torrent_seeds')
     def update_torrent_seeds(self, tracker, topic_id, seeds, leeches):
         query = "UPDATE torrents SET seeds = ?, leeches = ? WHERE tracker = ? AND topic_id = ?"
         with db_lock:
@@ -157,6 +579,38 @@ class MovieDatabase:
                 conn.execute(query, (seeds, leeches, tracker, topic_id))
                 conn.commit()
 
+    @timed(DB_DURATION, operation='update_torrent_seeds_bulk')
+    def update_torrent_seeds_bulk(self, tracker, rows):
+        """
+        Массово обновляет сиды и личи уже известных раздач.
+        rows - список кортежей (topic_id, seeds, leeches). Возвращает число обновленных строк.
+        """
+        query = "UPDATE torrents SET seeds = ?, leeches = ? WHERE tracker = ? AND topic_id = ?"
+        params = [(seeds, leeches, tracker, topic_id) for topic_id, seeds, leeches in rows]
+        with db_lock:
+            with self.get_connection() as conn:
+                cursor = conn.executemany(query, params)
+                conn.commit()
+                return cursor.rowcount
+
+    @timed(DB_DURATION, operation='update_torrent_parsed')
+    def update_torrent_parsed(self, tracker, topic_id, movie_id, topic_title, quality=None, file_format=None, translation=None):
+        """Обновляет поля раздачи, полученные разбором заголовка/страницы. Пустые значения не затирают существующие."""
+        query = """
+        UPDATE torrents SET
+            movie_id = ?, topic_title = ?,
+            quality = COALESCE(NULLIF(?, ''), quality),
+            file_format = COALESCE(NULLIF(?, ''), file_format),
+            translation = COALESCE(NULLIF(?, ''), translation)
+        WHERE tracker = ? AND topic_id = ?
+        """
+        with db_lock:
+            with self.get_connection() as conn:
+                conn.execute(query, (movie_id, topic_title, quality, file_format, translation, tracker, topic_id))
+                conn.commit()
+
+    @timed(DB_DURATION, operation='find_movie_by_title_and_year')
+    @profiled('db: find_movie_by_title_and_year')
     def find_movie_by_title_and_year(self, title, original_title, year):
         """
         Ищет фильм в базе по названию и году.
@@ -188,6 +642,7 @@ class MovieDatabase:
             
         return None
 
+    @timed(DB_DURATION, operation='update_now_playing_list')
     def update_now_playing_list(self, movie_ids):
         """Очищает старый список 'Сейчас смотрят' и вставляет новый"""
         with db_lock:
@@ -196,3 +651,23 @@ class MovieDatabase:
                 for mid in movie_ids:
                     conn.execute("INSERT OR IGNORE INTO now_playing (movie_id) VALUES (?)", (mid,))
                 conn.commit()
+
+    def get_forum_crawl_state(self, tracker, forum_id):
+        """Возвращает состояние обхода форума (максимальный topic_id, время и темп) или None."""
+        query = "SELECT max_topic_id, last_crawl_at, topics_per_hour FROM forum_crawl_state WHERE tracker = ? AND forum_id = ?"
+        with self.get_connection() as conn:
+            row = conn.execute(query, (tracker, int(forum_id))).fetchone()
+            if row:
+                return {"max_topic_id": row[0] or 0, "last_crawl_at": row[1], "topics_per_hour": row[2] or 0.0}
+            return None
+
+    @timed(DB_DURATION, operation='update_forum_crawl_state')
+    def update_forum_crawl_state(self, tracker, forum_id, max_topic_id, last_crawl_at, topics_per_hour):
+        query = """
+        INSERT OR REPLACE INTO forum_crawl_state (tracker, forum_id, max_topic_id, last_crawl_at, topics_per_hour)
+        VALUES (?, ?, ?, ?, ?)
+        """
+        with db_lock:
+            with self.get_connection() as conn:
+                conn.execute(query, (tracker, int(forum_id), max_topic_id, last_crawl_at, topics_per_hour))
+                conn.commit()
@@ -0,0 +1,129 @@
+import os
+import json
+import gzip
+import time
+import sqlite3
+from client_db import CLIENT_COLUMNS, CLIENT_SOURCES
+
+# Первичный ключ каждой выгружаемой таблицы
+EXPORT_TABLES = {
+    'movies': 'id',
+    'torrents': 'id',
+    'now_playing': 'movie_id',
+}
+MANIFEST_NAME = "manifest.json"
+
+
+def get_db_version(conn):
+    """Текущая версия БД - последний номер в журнале изменений (не уменьшается после очистки)."""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+
+def load_manifest(export_dir):
+    try:
+        with open(os.path.join(export_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"version": 0, "snapshot": None, "deltas": []}
+
+
+def save_manifest(export_dir, manifest):
+    path = os.path.join(export_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def collect_changes(conn, from_version, to_version):
+    """
+    Сворачивает журнал изменений (from_version, to_version] до последней операции по каждой строке
+    и возвращает {таблица: {"upsert": [строки], "delete": [ключи]}}.
+    Измененная строка, которой нет в CLIENT_SOURCES (например, раздача упала до 0 сидов), уходит клиентам
+    как удаление - так дельты сходятся с полной базой из build_client_db.
+    """
+    latest = {}
+    cursor = conn.execute(
+        "SELECT table_name, row_id, op FROM change_log WHERE seq > ? AND seq <= ? ORDER BY seq",
+        (from_version, to_version)
+    )
+    for table_name, row_id, op in cursor:
+        latest[(table_name, row_id)] = op
+
+    changes = {}
+    for table_name, pk in EXPORT_TABLES.items():
+        upsert_ids = [row_id for (t, row_id), op in latest.items() if t == table_name and op == 'upsert']
+        delete_ids = [row_id for (t, row_id), op in latest.items() if t == table_name and op == 'delete']
+        rows = []
+        for i in range(0, len(upsert_ids), 500):
+            chunk = upsert_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            # Только колонки клиентской базы (см. client_db)
+            columns = CLIENT_COLUMNS[table_name]
+            cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {CLIENT_SOURCES[table_name]} WHERE {pk} IN ({placeholders})", chunk)
+            rows.extend(dict(zip(columns, row)) for row in cursor)
+        exported = {row[pk] for row in rows}
+        delete_ids.extend(row_id for row_id in upsert_ids if row_id not in exported)
+        if rows or delete_ids:
+            changes[table_name] = {"upsert": rows, "delete": delete_ids}
+    return changes
+
+
+def write_delta(db_path, export_dir, from_version):
+    """
+    Пишет сжатый файл изменений с версии from_version до текущей.
+    Журнал не очищается: это делает prune_change_log, когда манифест с этой дельтой опубликован.
+    Возвращает (to_version, путь к файлу или None, если изменений нет).
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    with sqlite3.connect(db_path) as conn:
+        to_version = get_db_version(conn)
+        if to_version <= from_version:
+            return to_version, None
+
+        changes = collect_changes(conn, from_version, to_version)
+        path = os.path.join(export_dir, f"delta_{from_version}_{to_version}.json.gz")
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump({"from": from_version, "to": to_version, "created_at": time.time(), "changes": changes},
+                      f, ensure_ascii=False, separators=(',', ':'))
+    return to_version, path
+
+
+def read_db_version(db_path):
+    """Версия БД по пути к файлу. Берется до снимка: изменения после нее попадут и в следующую дельту."""
+    with sqlite3.connect(db_path) as conn:
+        return get_db_version(conn)
+
+
+def prune_change_log(db_path, version):
+    """
+    Удаляет из журнала изменения до version включительно. Вызывается только после публикации манифеста,
+    в котором version - последняя версия: если выгрузка сорвется раньше, дельту можно будет собрать заново.
+    """
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM change_log WHERE seq <= ?", (version,))
+        conn.commit()
+
+
+def is_snapshot_due(manifest, interval_days):
+    snapshot = manifest.get("snapshot")
+    if not snapshot:
+        return True
+    return time.time() - snapshot.get("created_at", 0) >= interval_days * 86400
+
+
+def prune_deltas(export_dir, manifest):
+    """Убирает из манифеста и с диска дельты, которые старее текущего снимка."""
+    snapshot_version = manifest["snapshot"]["version"] if manifest.get("snapshot") else 0
+    keep = []
+    for delta in manifest.get("deltas", []):
+        if delta["from"] >= snapshot_version:
+            keep.append(delta)
+        else:
+            try:
+                os.remove(os.path.join(export_dir, delta["file"]))
+            except OSError:
+                pass
+    manifest["deltas"] = keep
@@ -0,0 +1,165 @@
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import BaseAdapter
+
+ARCHIVE_DIR = os.environ.get("HTTP_ARCHIVE_DIR", "data/archive")
+
+# Параметры, которые не должны попадать в ключ архива (секреты)
+SECRET_PARAMS = {"api_key"}
+
+
+def normalize_url(url):
+    """Убирает из URL секретные параметры, чтобы ключ архива не зависел от способа авторизации."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+class HttpArchive:
+    """
+    Архив сырых HTTP-ответов: тела хранятся сжатыми и адресуются по sha256,
+    индекс (URL, время загрузки) лежит в отдельной SQLite базе.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, "index.db")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        with sqlite3.connect(self.index_path) as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY,
+                url TEXT,
+                fetched_at REAL,
+                status INTEGER,
+                content_type TEXT,
+                sha256 TEXT
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_url ON responses(url, fetched_at)")
+            conn.commit()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}.gz")
+
+    def put(self, url, content, status=200, content_type=None, fetched_at=None):
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        # Одинаковые ответы хранятся один раз
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, blob_path)
+
+        with self._lock:
+            with sqlite3.connect(self.index_path) as conn:
+                conn.execute(
+                    "INSERT INTO responses (url, fetched_at, status, content_type, sha256) VALUES (?, ?, ?, ?, ?)",
+                    (normalize_url(url), fetched_at or time.time(), status, content_type, digest)
+                )
+                conn.commit()
+        return digest
+
+    def read(self, digest):
+        with gzip.open(self._blob_path(digest), 'rb') as f:
+            return f.read()
+
+    def latest(self, url):
+        """Последний сохраненный ответ для URL: (status, content_type, content) или None."""
+        with sqlite3.connect(self.index_path) as conn:
+            row = conn.execute(
+                "SELECT status, content_type, sha256 FROM responses WHERE url = ? ORDER BY fetched_at DESC LIMIT 1",
+                (normalize_url(url),)
+            ).fetchone()
+        if not row:
+            return None
+        return row[0], row[1], self.read(row[2])
+
+    def iter_responses(self, url_like, since=None):
+        """Перебирает успешные ответы с URL по шаблону LIKE в порядке загрузки: (url, fetched_at, content)."""
+        query = "SELECT url, fetched_at, sha256 FROM responses WHERE url LIKE ? AND status = 200 AND fetched_at >= ? ORDER BY fetched_at"
+        with sqlite3.connect(self.index_path) as conn:
+            rows = conn.execute(query, (url_like, since or 0)).fetchall()
+        for url, fetched_at, digest in rows:
+            yield url, fetched_at, self.read(digest)
+
+    def record(self, response, *args, **kwargs):
+        """Хук requests: сохраняет тело каждого GET-ответа."""
+        if response.request.method != 'GET':
+            return
+        try:
+            self.put(response.request.url, response.content, response.status_code, response.headers.get('Content-Type'))
+        except Exception:
+            pass
+
+
+class ReplayAdapter(BaseAdapter):
+    """Транспорт requests, отдающий ответы из архива вместо обращения к сети."""
+
+    def __init__(self, archive):
+        super().__init__()
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        entry = self.archive.latest(request.url)
+        if entry is None:
+            raise requests.exceptions.ConnectionError(f"Нет в архиве: {normalize_url(request.url)}", request=request)
+        status, content_type, content = entry
+        response = requests.Response()
+        response.status_code = status
+        response._content = content
+        response.url = request.url
+        response.request = request
+        if content_type:
+            response.headers['Content-Type'] = content_type
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+    def close(self):
+        pass
+
+
+_archive = None
+_replay = False
+
+
+def get_archive():
+    global _archive
+    if _archive is None:
+        _archive = HttpArchive()
+    return _archive
+
+
+def is_enabled():
+    return _replay or os.environ.get("HTTP_ARCHIVE", "").lower() in ("1", "true", "yes")
+
+
+def enable_replay():
+    """Переключает все сессии, созданные после вызова, на чтение из архива."""
+    global _replay
+    _replay = True
+
+
+def is_replay():
+    return _replay
+
+
+def setup_session(session):
+    """Подключает к сессии запись в архив или воспроизведение из него (если включено)."""
+    if _replay:
+        adapter = ReplayAdapter(get_archive())
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    elif is_enabled():
+        session.hooks['response'].append(get_archive().record)
+    return session
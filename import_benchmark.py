@@ -0,0 +1,90 @@
+"""
+Замер времени импорта по режимам парсера через python -X importtime.
+
+    python import_benchmark.py          # таблица по режимам
+    python import_benchmark.py --check  # код выхода 1, если режим вышел за бюджет
+
+Для каждого режима импортируется main и вызывается main.import_stage_modules(режим) - тот же список
+модулей этапов (main.STAGE_MODULES), что подгружает run_job. Считается кумулятивное
+время импортов верхнего уровня из этого кода; модули, которые интерпретатор загружает при старте
+(их список берется из запуска python -c pass), не учитываются.
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# Бюджет на импорт режима, мс (с запасом примерно вдвое от замеров на рабочей машине)
+MODE_BUDGET_MS = {
+    'main': 150,
+    'trends': 300,
+    'tmdb': 350,
+    'seeds': 500,
+    'rutracker': 500,
+    'nnmclub': 500,
+    'cron': 550,
+    'export': 550,
+}
+
+# import time: <собственное, мкс> | <кумулятивное, мкс> | <отступ по вложенности><модуль>
+IMPORTTIME_RE = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def top_level_imports(code):
+    """{модуль: кумулятивное время, мкс} для импортов верхнего уровня при запуске python -c code."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1]
+        # Не установлена зависимость - отдельное исключение, тест в этом случае пропускается
+        if error.startswith('ModuleNotFoundError'):
+            raise ModuleNotFoundError(error)
+        raise RuntimeError(error)
+    imports = {}
+    for match in map(IMPORTTIME_RE.match, result.stderr.splitlines()):
+        if match and not match.group(2):
+            imports[match.group(3)] = int(match.group(1))
+    return imports
+
+
+def measure(mode, repeat=3):
+    """Минимальное по повторам время импорта main и модулей этапов mode ('main' - только main), мс."""
+    code = "import main" if mode == 'main' else f"import main; main.import_stage_modules({mode!r})"
+    startup = set(top_level_imports("pass"))
+    best = None
+    for _ in range(repeat):
+        imports = top_level_imports(code)
+        total_us = sum(us for module, us in imports.items() if module not in startup)
+        best = total_us if best is None else min(best, total_us)
+    return best / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта по режимам парсера")
+    parser.add_argument('--check', action='store_true', help='Проверить бюджеты MODE_BUDGET_MS')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    failed = []
+    for mode in MODE_BUDGET_MS:
+        try:
+            elapsed = measure(mode, args.repeat)
+        except (RuntimeError, ImportError) as e:
+            print(f"{mode:<10} ошибка импорта: {e}")
+            failed.append(mode)
+            continue
+        budget = MODE_BUDGET_MS[mode]
+        mark = "OK" if elapsed <= budget else "ПРЕВЫШЕН"
+        print(f"{mode:<10} {elapsed:8.1f} мс  (бюджет {budget} мс) {mark}")
+        if elapsed > budget:
+            failed.append(mode)
+
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import time
+import queue
+import logging
+import threading
+import itertools
+import multiprocessing
+import parser_logging
+
+# Какие ресурсы занимает задача каждого типа. Задачи без общих ресурсов выполняются одновременно.
+JOB_RESOURCES = {
+    'tmdb': {'tmdb', 'trends'},
+    'trends': {'trends'},
+    'rutracker': {'rutracker'},
+    'nnmclub': {'nnmclub'},
+    'seeds': {'rutracker', 'nnmclub'},
+    'cron': {'tmdb', 'trends', 'rutracker', 'nnmclub'},
+    # Выгрузка базы ставится сама, когда очередь пустеет, и идет одна
+    'export': {'tmdb', 'trends', 'rutracker', 'nnmclub'},
+}
+JOB_TYPES = tuple(t for t in JOB_RESOURCES if t != 'export')
+
+DEFAULT_WORKERS = 2
+# Сколько завершенных задач показывать в статусе
+HISTORY_SIZE = 20
+
+
+def progress_key(job_id):
+    """Имя файла прогресса задачи в data/progress (без .json)."""
+    return f"job-{job_id}"
+
+
+def _worker_main(worker_id, task_queue, result_queue, cancel_event, log_queue):
+    """
+    Процесс-воркер: один раз импортирует парсер и держит БД и клиенты источников
+    (ParserSession) между задачами. Отмена задачи - событие cancel_event, а не файл.
+    Лог пишет менеджер: записи уходят в log_queue.
+    """
+    import main as parser
+    parser.setup_logging(log_queue)
+    parser.metrics.start_publisher(f"worker-{worker_id}")
+    session = parser.ParserSession()
+    result_queue.put(('ready', worker_id, None, None))
+
+    while True:
+        job = task_queue.get()
+        if job is None:
+            break
+        job_id, job_type = job
+        result_queue.put(('started', worker_id, job_id, None))
+        # Прогресс задачи - в свой файл (см. progress_key), воркеры не перетирают друг друга
+        parser.progress.start(progress_key(job_id), job_type)
+        error = None
+        try:
+            if job_type == 'export':
+                parser.export_database(session.db_name)
+            else:
+                parser.run_job(job_type, session, cancel_event, export=False)
+        except Exception as e:
+            logging.error(f"Ошибка задачи {job_type}: {e}")
+            error = str(e)
+        parser.metrics.flush()
+        parser.progress.finish()
+        result_queue.put(('finished', worker_id, job_id, error))
+
+
+class Job:
+    def __init__(self, job_id, job_type):
+        self.id = job_id
+        self.type = job_type
+        self.status = 'pending'
+        self.worker = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'type': self.type, 'status': self.status, 'error': self.error,
+            'created_at': self.created_at, 'started_at': self.started_at, 'finished_at': self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Очередь задач парсера с пулом прогретых процессов-воркеров.
+    Задачи, не конфликтующие по ресурсам (JOB_RESOURCES), выполняются параллельно;
+    после того как очередь опустела, база выгружается для клиентов одной задачей export.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self._ctx = multiprocessing.get_context('spawn')
+        self._result_queue = self._ctx.Queue()
+        # Записи лога всех воркеров пишет в data/parser.log один listener в этом процессе
+        self._log_queue = self._ctx.Queue()
+        parser_logging.start_listener(self._log_queue)
+        self._workers = {}
+        self._jobs = {}
+        self._pending = []
+        self._history = []
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._stopped = False
+        for worker_id in range(workers):
+            self._start_worker(worker_id)
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def _start_worker(self, worker_id):
+        task_queue = self._ctx.Queue()
+        cancel_event = self._ctx.Event()
+        process = self._ctx.Process(
+            target=_worker_main, args=(worker_id, task_queue, self._result_queue, cancel_event, self._log_queue),
+            name=f"parser-worker-{worker_id}", daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = {'process': process, 'queue': task_queue, 'cancel': cancel_event, 'job': None}
+
+    def submit(self, job_type):
+        """Ставит задачу в очередь. Если такая задача уже ждет или выполняется, возвращает ее."""
+        if job_type not in JOB_RESOURCES:
+            raise ValueError(f"Неизвестный тип задачи: {job_type}")
+        with self._lock:
+            for job in self._active_jobs():
+                if job.type == job_type:
+                    return job
+            job = Job(next(self._ids), job_type)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._dispatch()
+            return job
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if job.status == 'pending':
+                self._pending.remove(job)
+                self._finish(job, 'cancelled')
+            elif job.status == 'running':
+                job.status = 'cancelling'
+                self._workers[job.worker]['cancel'].set()
+            return True
+
+    def cancel_all(self):
+        with self._lock:
+            for job in list(self._active_jobs()):
+                self.cancel(job.id)
+
+    def is_busy(self):
+        with self._lock:
+            return bool(self._pending) or any(w['job'] is not None for w in self._workers.values())
+
+    def is_stopping(self):
+        with self._lock:
+            return any(job.status == 'cancelling' for job in self._active_jobs())
+
+    def snapshot(self):
+        """Состояние очереди для /api/status."""
+        with self._lock:
+            return {
+                'active': [job.to_dict() for job in self._active_jobs()],
+                'history': [job.to_dict() for job in self._history],
+            }
+
+    def shutdown(self, timeout=5):
+        with self._lock:
+            self._stopped = True
+            self.cancel_all()
+            for worker in self._workers.values():
+                worker['queue'].put(None)
+        deadline = time.time() + timeout
+        for worker in self._workers.values():
+            worker['process'].join(max(0, deadline - time.time()))
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+
+    def _active_jobs(self):
+        running = [w['job'] for w in self._workers.values() if w['job'] is not None]
+        return running + self._pending
+
+    def _busy_resources(self):
+        busy = set()
+        for worker in self._workers.values():
+            if worker['job'] is not None:
+                busy |= JOB_RESOURCES[worker['job'].type]
+        return busy
+
+    def _dispatch(self):
+        """Запускает ожидающие задачи на свободных воркерах, если их ресурсы не заняты."""
+        if self._stopped:
+            return
+        busy = self._busy_resources()
+        for job in list(self._pending):
+            idle = [w_id for w_id, w in self._workers.items() if w['job'] is None and w['process'].is_alive()]
+            if not idle:
+                break
+            if JOB_RESOURCES[job.type] & busy:
+                continue
+            worker = self._workers[idle[0]]
+            self._pending.remove(job)
+            worker['cancel'].clear()
+            worker['job'] = job
+            job.worker = idle[0]
+            job.status = 'running'
+            job.started_at = time.time()
+            busy |= JOB_RESOURCES[job.type]
+            if job.type != 'export':
+                self._dirty = True
+            worker['queue'].put((job.id, job.type))
+
+        if self._dirty and not self._active_jobs():
+            self._dirty = False
+            job = Job(next(self._ids), 'export')
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._dispatch()
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        self._history.insert(0, job)
+        for old in self._history[HISTORY_SIZE:]:
+            self._jobs.pop(old.id, None)
+        del self._history[HISTORY_SIZE:]
+
+    def _monitor(self):
+        """Принимает сообщения воркеров и перезапускает упавшие процессы."""
+        while True:
+            try:
+                event, worker_id, job_id, error = self._result_queue.get(timeout=1.0)
+            except queue.Empty:
+                event = None
+            except (EOFError, OSError):
+                return
+
+            with self._lock:
+                if event == 'finished':
+                    worker = self._workers[worker_id]
+                    job = worker['job']
+                    worker['job'] = None
+                    if job is not None:
+                        cancelled = job.status == 'cancelling'
+                        self._finish(job, 'failed' if error else 'cancelled' if cancelled else 'done', error)
+                    self._dispatch()
+
+                if self._stopped:
+                    continue
+                for worker_id, worker in list(self._workers.items()):
+                    if worker['process'].is_alive():
+                        continue
+                    logging.error(f"Воркер парсера {worker_id} завершился (код {worker['process'].exitcode}), перезапускаем.")
+                    if worker['job'] is not None:
+                        self._finish(worker['job'], 'failed', "Процесс воркера завершился")
+                    self._start_worker(worker_id)
+                    self._dispatch()
@@ -1,42 +1,275 @@
 import sys
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import boto3
 import hashlib
-from botocore.client import Config
 import time
-import requests
 import json
 import re
 import logging
 import zipfile
+import sqlite3
 import os
 import argparse
-from tqdm import tqdm
+import importlib
+from dotenv import load_dotenv
 from database import MovieDatabase
-from tmdb_client import TMDBClient
-from rutracker_client import RutrackerClient
-from nnmclub_client import NnmclubClient
+import release_parser
+import delta_export
+from client_db import build_client_db
+import metrics
+from metrics import EXPORT_DURATION, STAGE_DURATION, STAGE_ERRORS, UPLOAD_BYTES, timed
+import profiler
+from profiler import profiled
+import parser_logging
+from parser_logging import sampled
+
+# Тяжелые зависимости (boto3, tqdm, requests, клиенты трекеров с bs4/lxml/cloudscraper)
+# импортируются только на тех этапах, которые их используют: короткие режимы стартуют быстро.
+# Переменные окружения (ключи R2 и т.п.) нужны и без клиентов, поэтому .env читаем здесь.
+load_dotenv()
 DATA_DIR = 'data/'
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# Настройка логирования
-logging.basicConfig(
-    filename=os.path.join(DATA_DIR, 'parser.log'),
-    filemode='w', # Очищаем файл при каждом запуске
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    encoding='utf-8'
-)
+# Модули, которые подгружают этапы каждого режима. run_job импортирует их в начале задачи,
+# тест времени импорта (tests/test_import_budget.py) замеряет режимы по этому же списку
+STAGE_MODULES = {
+    'trends': ('tmdb_client',),
+    'tmdb': ('tmdb_client', 'tqdm'),
+    'seeds': ('rutracker_client', 'nnmclub_client'),
+    'rutracker': ('tmdb_client', 'rutracker_client', 'title_index'),
+    'nnmclub': ('tmdb_client', 'nnmclub_client', 'title_index'),
+    'cron': ('tmdb_client', 'tqdm', 'rutracker_client', 'nnmclub_client', 'title_index'),
+    # Выгрузка в облако в конце запуска (только если заданы ключи R2)
+    'export': ('boto3', 'botocore.client', 'botocore.exceptions', 'boto3.s3.transfer'),
+}
 
-def update_progress(task_name, current, total):
-    try:
-        tmp_name = os.path.join(DATA_DIR, 'progress.tmp')
-        with open(tmp_name, 'w', encoding='utf-8') as f:
-            json.dump({'task': task_name, 'current': current, 'total': total, 'timestamp': time.time()}, f)
-        os.replace(tmp_name, os.path.join(DATA_DIR, 'progress.json'))
-    except Exception as e:
-        print(f"Progress error: {e}")
+def import_stage_modules(mode):
+    """Импортирует модули этапов режима mode (STAGE_MODULES)."""
+    for name in STAGE_MODULES.get(mode, ()):
+        importlib.import_module(name)
+
+def setup_logging(log_queue=None):
+    """
+    Настройка логирования. При запуске из консоли процесс сам пишет data/parser.log с ротацией,
+    воркеры менеджера задач передают записи в очередь log_queue процесса web_app.
+    """
+    if log_queue is None:
+        parser_logging.start_listener()
+    else:
+        parser_logging.connect(log_queue)
+
+# Прогресс каждой задачи пишется в свой файл data/progress/<ключ>.json, web_app сводит их при чтении
+PROGRESS_DIR = os.path.join(DATA_DIR, 'progress')
+# Как часто прогресс сбрасывается в файл (web_app опрашивает его раз в 1.5 с)
+PROGRESS_INTERVAL = 1.0
+# Скорость и оставшееся время считаются по окну последних секунд
+PROGRESS_RATE_WINDOW = 30.0
+
+class ProgressReporter:
+    """
+    Прогресс парсера в памяти. update() только меняет счетчики, в файл состояние пишет фоновый
+    поток не чаще раза в interval секунд, так что частые обновления из горячих циклов ничего не стоят.
+    Для общей задачи и каждого источника считаются скорость (элементов в секунду) и оставшееся время.
+    Задачи менеджера идут в нескольких воркерах одновременно, поэтому у каждой задачи свой файл:
+    start() привязывает прогресс к задаче, finish() удаляет ее файл, не трогая прогресс остальных.
+    """
+
+    def __init__(self, directory, interval=PROGRESS_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.path = None
+        self._key = None
+        self._label = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._task = self._entry(None, "Ожидание", 0, 0, time.time())
+        self._sources = {}
+        self._thread = None
+
+    @staticmethod
+    def _entry(prev, task, current, total, now):
+        # Замер скорости начинается заново со сменой задачи или при откате счетчика
+        if prev is None or prev['task'] != task or current < prev['current'] or now - prev['window_at'] > PROGRESS_RATE_WINDOW * 2:
+            window_at, window_current = now, current
+        else:
+            window_at, window_current = prev['window_at'], prev['window_current']
+            if now - window_at > PROGRESS_RATE_WINDOW:
+                # Сдвигаем окно: скорость за последние PROGRESS_RATE_WINDOW секунд, а не за весь этап
+                elapsed = now - window_at
+                rate = (current - window_current) / elapsed
+                window_at = now - PROGRESS_RATE_WINDOW
+                window_current = current - rate * PROGRESS_RATE_WINDOW
+        return {'task': task, 'current': current, 'total': total,
+                'window_at': window_at, 'window_current': window_current}
+
+    @staticmethod
+    def _public(entry, now):
+        result = {'task': entry['task'], 'current': entry['current'], 'total': entry['total'], 'rate': None, 'eta': None}
+        elapsed = now - entry['window_at']
+        if elapsed >= 1.0 and entry['current'] > entry['window_current']:
+            rate = (entry['current'] - entry['window_current']) / elapsed
+            result['rate'] = round(rate, 2)
+            if entry['total'] > entry['current']:
+                result['eta'] = int((entry['total'] - entry['current']) / rate)
+        return result
+
+    def start(self, key, label):
+        """Начинает прогресс задачи key (label - тип задачи для панели) с чистого состояния."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self.path = os.path.join(self.directory, f"{key}.json")
+            self._key, self._label = key, label
+            self._task = self._entry(None, "Инициализация", 0, 0, time.time())
+            self._sources = {}
+        self.flush()
+
+    def finish(self):
+        """Задача завершена: ее файл удаляется, панель показывает только работающие задачи."""
+        with self._write_lock:
+            with self._lock:
+                path, self.path = self.path, None
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def update(self, task_name, current, total, source=None):
+        now = time.time()
+        with self._lock:
+            if source:
+                self._sources[source] = self._entry(self._sources.get(source), task_name, current, total, now)
+            elif total == 0:
+                self._sources.clear()
+            self._task = self._entry(self._task, task_name, current, total, now)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="progress-publisher")
+                self._thread.start()
+        self._dirty.set()
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            state = self._public(self._task, now)
+            state['job'] = self._key
+            state['label'] = self._label
+            state['timestamp'] = now
+            state['sources'] = {name: self._public(entry, now) for name, entry in self._sources.items()}
+        return state
+
+    def flush(self):
+        """Сразу пишет текущее состояние (конец этапа, завершение процесса)."""
+        self._dirty.clear()
+        try:
+            with self._write_lock:
+                path = self.path
+                if path is None:
+                    return
+                tmp_name = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_name, 'w', encoding='utf-8') as f:
+                    json.dump(self.snapshot(), f, ensure_ascii=False)
+                os.replace(tmp_name, path)
+        except Exception as e:
+            print(f"Progress error: {e}")
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            self.flush()
+            time.sleep(self.interval)
+
+progress = ProgressReporter(PROGRESS_DIR)
+
+def update_progress(task_name, current, total, source=None):
+    progress.update(task_name, current, total, source)
+
+# Адаптивный обход форумов трекеров
+CRAWL_INITIAL_PAGES = 2      # Первый обход форума без сохраненного состояния
+CRAWL_MAX_PAGES = 10         # Предел листания, пока на страницах есть новые топики
+CRAWL_TARGET_NEW_TOPICS = 10 # Сколько новых топиков должно накопиться к следующему обходу
+CRAWL_MIN_INTERVAL_H = 1
+CRAWL_MAX_INTERVAL_H = 48
+
+def plan_forum_crawl(db, tracker, forum_id):
+    """
+    Решает, пора ли обходить форум, и с какими параметрами.
+    Возвращает (due, pages, known_max_topic_id, state). Рутрекер сортирует темы по последнему
+    сообщению, поэтому для него known_max_topic_id в остановке листания не используется.
+    """
+    state = db.get_forum_crawl_state(tracker, forum_id)
+    if not state or not state['last_crawl_at']:
+        return True, CRAWL_INITIAL_PAGES, None, state
+
+    rate = state['topics_per_hour']
+    interval_h = CRAWL_TARGET_NEW_TOPICS / rate if rate > 0 else CRAWL_MAX_INTERVAL_H
+    interval_h = min(max(interval_h, CRAWL_MIN_INTERVAL_H), CRAWL_MAX_INTERVAL_H)
+    elapsed_h = (time.time() - state['last_crawl_at']) / 3600
+    if elapsed_h < interval_h:
+        return False, 0, state['max_topic_id'], state
+    return True, CRAWL_MAX_PAGES, state['max_topic_id'], state
+
+def record_forum_crawl(db, tracker, forum_id, state, processed_ids, crawl_started_at):
+    """
+    Сохраняет отметку максимального topic_id и обновляет оценку темпа появления топиков.
+    Вызывается только после полного прохода по списку: processed_ids - топики, которые действительно
+    обработаны, чтобы прерванный обход не сдвинул отметку за необработанные топики.
+    """
+    known_max = state['max_topic_id'] if state else 0
+    max_topic_id = max(list(processed_ids) + [known_max])
+
+    rate = state['topics_per_hour'] if state else 0.0
+    if state and state['last_crawl_at']:
+        new_count = sum(1 for topic_id in processed_ids if topic_id > known_max)
+        elapsed_h = max((crawl_started_at - state['last_crawl_at']) / 3600, 1e-3)
+        # Сглаживаем, чтобы один всплеск не сбивал интервал обхода
+        rate = 0.5 * rate + 0.5 * (new_count / elapsed_h)
+
+    db.update_forum_crawl_state(tracker, forum_id, max_topic_id, crawl_started_at, rate)
+
+RUTRACKER_CATEGORIES = [2, 18] # 2 - Кино, 18 - Сериалы
+
+NNM_FORUMS = [
+    # Горячие новинки
+    218, 954,
+    # Классика кино и Старые фильмы до 90-х
+    319, 885, 910, 912,
+    # Зарубежное кино
+    225, 227, 1296, 1299, 682, 884
+]
+NNM_TV_FORUMS = [
+    # Зарубежные сериалы
+    1344, 779, 1288, 787, 1141, 777, 786, 776, 785, 775, 
+    1265, 1242, 1140, 782, 773, 1142, 772, 771, 783, 1144, 
+    804, 1290, 1300, 784, 774, 922, 770, 780
+]
+
+# Легкий режим обновления сидов
+SEEDS_PAGES = 2
+SEEDS_WORKERS = 4
+
+def refresh_tracker_seeds(db, tracker, client, forum_ids, stop_event):
+    """
+    Параллельно обходит страницы списков тем и массово обновляет сиды/личи известных раздач.
+    Без сопоставления с фильмами и без захода в топики.
+    """
+    def fetch(forum_id):
+        if stop_event.is_set():
+            return []
+        return client.get_topics_from_forum(forum_id, pages=SEEDS_PAGES)
+
+    updated = 0
+    with ThreadPoolExecutor(max_workers=SEEDS_WORKERS) as executor:
+        futures = {executor.submit(fetch, forum_id): forum_id for forum_id in forum_ids}
+        for idx, future in enumerate(as_completed(futures), 1):
+            try:
+                topics = future.result()
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении сидов {tracker} форума {futures[future]}: {e}")
+                continue
+            updated += db.update_torrent_seeds_bulk(tracker, [(t['topic_id'], t['seeds'], t['leeches']) for t in topics])
+            update_progress(f"Обновление сидов: {tracker}", idx, len(forum_ids), source=tracker)
+    return updated
 
 def get_config():
     try:
@@ -45,78 +278,287 @@ def get_config():
     except:
         return {"run_tmdb": True, "run_rutracker": True, "cron_time": "02:00"}
 
-def upload_to_r2(file_path):
-    endpoint_url = os.environ.get('R2_ENDPOINT_URL')
-    access_key = os.environ.get('R2_ACCESS_KEY_ID')
-    secret_key = os.environ.get('R2_SECRET_ACCESS_KEY')
+# Файлы больше порога грузятся частями параллельно
+R2_MULTIPART_CHUNK = 16 * 1024 * 1024
+R2_MAX_CONCURRENCY = 8
+
+_r2_client = None
+_r2_transfer_config = None
+_r2_client_lock = threading.Lock()
+
+def get_r2_client():
+    """
+    Один клиент S3 на процесс (клиенты boto3 потокобезопасны), boto3 импортируется только здесь.
+    Endpoint берется из R2_ENDPOINT_URL, поэтому для проверки можно указать локальный S3-совместимый сервер.
+    Возвращает (клиент, TransferConfig).
+    """
+    global _r2_client, _r2_transfer_config
+    with _r2_client_lock:
+        if _r2_client is None:
+            import boto3
+            from botocore.client import Config
+            from boto3.s3.transfer import TransferConfig
+            _r2_transfer_config = TransferConfig(
+                multipart_threshold=R2_MULTIPART_CHUNK,
+                multipart_chunksize=R2_MULTIPART_CHUNK,
+                max_concurrency=R2_MAX_CONCURRENCY,
+                use_threads=True,
+            )
+            _r2_client = boto3.client('s3',
+                endpoint_url=os.environ.get('R2_ENDPOINT_URL'),
+                aws_access_key_id=os.environ.get('R2_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.environ.get('R2_SECRET_ACCESS_KEY'),
+                config=Config(signature_version='s3v4', max_pool_connections=R2_MAX_CONCURRENCY)
+            )
+        return _r2_client, _r2_transfer_config
+
+def file_md5(file_path):
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def is_uploaded(s3, bucket_name, object_name, md5):
+    """
+    Есть ли в корзине объект с тем же содержимым. MD5 храним в метаданных объекта,
+    т.к. ETag при загрузке по частям не равен MD5 файла; для старых объектов сверяем ETag.
+    """
+    from botocore.exceptions import ClientError
+    try:
+        head = s3.head_object(Bucket=bucket_name, Key=object_name)
+    except ClientError:
+        return False
+    return md5 in (head.get('Metadata', {}).get('md5'), head.get('ETag', '').strip('"'))
+
+def r2_configured():
+    return all(os.environ.get(name) for name in
+               ('R2_ENDPOINT_URL', 'R2_ACCESS_KEY_ID', 'R2_SECRET_ACCESS_KEY', 'R2_BUCKET_NAME'))
+
+@profiled('export: загрузка в R2')
+def upload_to_r2(file_path, md5=None):
+    """
+    Загружает файл в Cloudflare R2, если такого содержимого там еще нет.
+    Возвращает True, если объект в корзине актуален (загружен сейчас или не менялся).
+    """
     bucket_name = os.environ.get('R2_BUCKET_NAME')
     
-    if not all([endpoint_url, access_key, secret_key, bucket_name]):
+    if not r2_configured():
         logging.warning("Ключи R2 не заданы. Пропуск загрузки в облако.")
-        return
+        return False
     try:
         update_progress("Выгрузка в облако", 99, 100)
-        logging.info(f"Начало загрузки {file_path} в Cloudflare R2...")
-        
-        s3 = boto3.client('s3',
-            endpoint_url=endpoint_url,
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            config=Config(signature_version='s3v4')
-        )
-        
+        s3, transfer_config = get_r2_client()
         object_name = os.path.basename(file_path)
-        s3.upload_file(file_path, bucket_name, object_name)
+        md5 = md5 or file_md5(file_path)
+        if is_uploaded(s3, bucket_name, object_name, md5):
+            logging.info(f"{object_name} в R2 не изменился, загрузка пропущена.")
+            UPLOAD_BYTES.inc(os.path.getsize(file_path), result='skipped')
+            return True
+
+        logging.info(f"Начало загрузки {file_path} в Cloudflare R2...")
+        with EXPORT_DURATION.time(step='upload'):
+            s3.upload_file(file_path, bucket_name, object_name,
+                           ExtraArgs={'Metadata': {'md5': md5}}, Config=transfer_config)
+        UPLOAD_BYTES.inc(os.path.getsize(file_path), result='uploaded')
         logging.info("Успешная загрузка в Cloudflare R2!")
+        return True
     except Exception as e:
+        UPLOAD_BYTES.inc(0, result='failed')
         logging.error(f"Ошибка при загрузке в R2: {e}")
+        return False
+
+class HashingWriter:
+    """Файловая обертка, считающая MD5 по мере записи (без повторного чтения архива)."""
+
+    def __init__(self, f):
+        self.f = f
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def write(self, data):
+        self.md5.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        self.f.flush()
+
+@timed(EXPORT_DURATION, step='snapshot')
+def take_db_snapshot(db_name, snapshot_path):
+    """Согласованная копия БД даже при активной записи: VACUUM INTO (или backup API для старого SQLite)."""
+    if os.path.exists(snapshot_path):
+        os.remove(snapshot_path)
+    src = sqlite3.connect(db_name)
+    try:
+        try:
+            src.execute("VACUUM INTO ?", (snapshot_path,))
+        except sqlite3.OperationalError:
+            dst = sqlite3.connect(snapshot_path)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+    finally:
+        src.close()
+
+@timed(EXPORT_DURATION, step='compress')
+def compress_db(db_path, archive_base, arcname, export_format):
+    """
+    Сжимает файл БД в архив (zip или многопоточный zstandard), считая MD5 по ходу записи.
+    Возвращает (путь к архиву, путь к файлу с md5, md5).
+    """
+    zstd = None
+    if export_format == "zst":
+        try:
+            import zstandard as zstd
+        except ImportError:
+            logging.warning("Пакет zstandard не установлен, используем zip.")
+
+    if zstd:
+        archive_name, md5_name = f"{archive_base}.db.zst", f"{archive_base}.db.zst.md5"
+    else:
+        archive_name, md5_name = f"{archive_base}.zip", f"{archive_base}.md5"
+    temp_archive = os.path.join(DATA_DIR, f"temp_{archive_name}")
+    final_archive = os.path.join(DATA_DIR, archive_name)
+
+    with open(temp_archive, "wb") as raw_f:
+        out = HashingWriter(raw_f)
+        if zstd:
+            compressor = zstd.ZstdCompressor(level=3, threads=-1)
+            with open(db_path, "rb") as src:
+                compressor.copy_stream(src, out)
+        else:
+            # Без seek() ZipFile пишет архив одним потоком
+            with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+                # Кладем внутрь архива сам файл (чтобы внутри не было пути DATA_DIR)
+                zipf.write(db_path, arcname=arcname)
+    hash_str = out.md5.hexdigest()
+    
+    # Безопасная замена файла (с попытками, если файл сейчас скачивают)
+    for _ in range(5):
+        try:
+            os.replace(temp_archive, final_archive)
+            break
+        except PermissionError:
+            time.sleep(2)
+
+    md5_file = os.path.join(DATA_DIR, md5_name)
+    with open(md5_file, "w") as f:
+        f.write(hash_str)
 
+    logging.info(f"База данных сжата в {archive_name} ({out.size} байт), MD5: {hash_str}")
+    return final_archive, md5_file, hash_str
+
+@profiled('export: снимок и архив')
 def create_zip(db_name="movies.db"):
+    """
+    Снимок базы -> компактная клиентская БД -> сжатый архив + MD5, загрузка в облако.
+    Формат задается export_format в конфиге: 'zip' (по умолчанию, для совместимости)
+    или 'zst' (многопоточный zstandard). При client_db_shards дополнительно собираются
+    отдельные архивы фильмов и сериалов. Возвращает (путь к архиву, md5) или (None, None) при ошибке,
+    в том числе если R2 настроен, а архив или его MD5 загрузить не удалось: на такой снимок манифест ссылаться не должен.
+    """
     if not db_name.startswith(DATA_DIR):
         db_name = os.path.join(DATA_DIR, os.path.basename(db_name))
         
     update_progress("Сжатие базы данных", 99, 100)
     logging.info("Сжатие базы данных...")
+    config = get_config()
+    export_format = config.get("export_format", "zip")
+    snapshot_path = os.path.join(DATA_DIR, "movies_snapshot.db")
+    client_path = os.path.join(DATA_DIR, "movies_client.db")
     try:
-        temp_zip = os.path.join(DATA_DIR, "movies_temp.zip")
-        final_zip = os.path.join(DATA_DIR, "movies.zip")
-        with zipfile.ZipFile(temp_zip, "w", zipfile.ZIP_DEFLATED) as zipf:
-            # Кладем внутрь архива сам файл (чтобы внутри не было пути DATA_DIR)
-            zipf.write(db_name, arcname=os.path.basename(db_name))
-        
-        # Безопасная замена файла (с попытками, если файл сейчас скачивают)
-        for _ in range(5):
-            try:
-                os.replace(temp_zip, final_zip)
-                break
-            except PermissionError:
-                time.sleep(2)
-                
-        logging.info("База данных успешно сжата в movies.zip")
-        
-        final_zip = os.path.join(DATA_DIR, "movies.zip")
-        md5_file = os.path.join(DATA_DIR, "movies.md5")
-        
-        # Генерируем MD5 хеш
-        md5_hash = hashlib.md5()
-        with open(final_zip, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                md5_hash.update(chunk)
-        hash_str = md5_hash.hexdigest()
+        take_db_snapshot(db_name, snapshot_path)
+        with EXPORT_DURATION.time(step='client_db'):
+            build_client_db(snapshot_path, client_path)
+        archive_path, md5_file, hash_str = compress_db(client_path, "movies", os.path.basename(db_name), export_format)
         
-        # Сохраняем в файл
-        with open(md5_file, "w") as f:
-            f.write(hash_str)
-            
-        logging.info(f"Сгенерирован MD5 хеш: {hash_str}")
-        
-        # Загружаем в облако оба файла
-        upload_to_r2(final_zip)
-        upload_to_r2(md5_file)
+        # Сначала архив, потом его MD5: клиент не должен увидеть хеш файла, которого еще нет
+        uploaded = upload_to_r2(archive_path, hash_str) and upload_to_r2(md5_file)
+        if not uploaded and r2_configured():
+            logging.error("Снимок базы не загружен в R2, манифест на него ссылаться не будет.")
+            return None, None
+
+        if config.get("client_db_shards", False):
+            for media_type in ("movie", "tv"):
+                build_client_db(snapshot_path, client_path, media_type=media_type)
+                shard_path, shard_md5_file, shard_hash = compress_db(client_path, f"movies_{media_type}", os.path.basename(db_name), export_format)
+                if upload_to_r2(shard_path, shard_hash):
+                    upload_to_r2(shard_md5_file)
+        return archive_path, hash_str
     except Exception as e:
         logging.error(f"Ошибка при сжатии базы данных: {e}")
+        return None, None
+    finally:
+        for path in (snapshot_path, client_path):
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def export_database(db_name="movies.db"):
+    """
+    Выгрузка для клиентов: каждый запуск - файл изменений (дельта) от прошлой версии,
+    полный снимок movies.zip - раз в snapshot_interval_days дней. Манифест загружается последним.
+    """
+    if not db_name.startswith(DATA_DIR):
+        db_name = os.path.join(DATA_DIR, os.path.basename(db_name))
+    export_dir = os.path.join(DATA_DIR, 'export')
+    os.makedirs(export_dir, exist_ok=True)
+    if r2_configured():
+        import_stage_modules('export')
+
+    try:
+        manifest = delta_export.load_manifest(export_dir)
+        interval_days = get_config().get("snapshot_interval_days", 7)
+
+        snapshot_published = False
+        if delta_export.is_snapshot_due(manifest, interval_days):
+            version = delta_export.read_db_version(db_name)
+            archive_path, md5 = create_zip(db_name)
+            # Манифест, старые дельты и журнал трогаем, только если снимок уже в облаке
+            if archive_path:
+                manifest["snapshot"] = {"version": version, "file": os.path.basename(archive_path), "md5": md5, "created_at": time.time()}
+                manifest["version"] = version
+                delta_export.prune_deltas(export_dir, manifest)
+                snapshot_published = True
+                logging.info(f"Полный снимок базы, версия {version}")
+            else:
+                logging.warning("Снимок не опубликован, выгружаем дельту; снимок повторим при следующем запуске.")
+        if not snapshot_published:
+            to_version, delta_path = delta_export.write_delta(db_name, export_dir, manifest["version"])
+            if delta_path:
+                manifest["deltas"].append({
+                    "from": manifest["version"], "to": to_version,
+                    "file": os.path.basename(delta_path), "size": os.path.getsize(delta_path)
+                })
+                manifest["version"] = to_version
+                logging.info(f"Дельта изменений {os.path.basename(delta_path)}: {os.path.getsize(delta_path)} байт")
+            else:
+                logging.info("Изменений в базе нет, дельта не создана.")
+
+        manifest_path = delta_export.save_manifest(export_dir, manifest)
+        # Манифест не должен ссылаться на дельту, которой нет в облаке. Уже загруженные
+        # дельты пропускаются по хешу, а не загруженные в прошлый раз догружаются сейчас.
+        if all([upload_to_r2(os.path.join(export_dir, d["file"])) for d in manifest["deltas"]]):
+            published = upload_to_r2(manifest_path)
+        else:
+            published = False
+            logging.warning("Не все дельты загружены, манифест в облаке не обновлен.")
+        # Журнал изменений чистим только после публикации манифеста (без R2 - после его записи на диск),
+        # иначе сбой загрузки или падение процесса теряли бы изменения из цепочки дельт
+        if published or not r2_configured():
+            delta_export.prune_change_log(db_name, manifest["version"])
+    except Exception as e:
+        logging.error(f"Ошибка при выгрузке базы: {e}")
 
 def process_tmdb_movie(movie_id, db, tmdb_client):
+    from requests.exceptions import HTTPError
     try:
         movie = tmdb_client.get_movie_details(movie_id)
         
@@ -164,13 +606,13 @@ def process_tmdb_movie(movie_id, db, tmdb_client):
             'movie'
         )
         
-        db.upsert_movie(movie_data)
-        logging.info(f"Сохранен фильм ID {movie_id}: {title}")
+        if db.upsert_movie(movie_data):
+            sampled("Сохранено фильмов", "Сохранен фильм ID %s: %s", movie_id, title)
         return True
         
-    except requests.exceptions.HTTPError as e:
+    except HTTPError as e:
         if e.response.status_code == 404:
-            logging.info(f"ID {movie_id} не найден. Пропускаем.")
+            sampled("Не найдено в TMDB", "ID %s не найден. Пропускаем.", movie_id)
         else:
             logging.error(f"HTTP ошибка для ID {movie_id}: {e}")
     except Exception as e:
@@ -178,6 +620,7 @@ def process_tmdb_movie(movie_id, db, tmdb_client):
     return False
 
 def process_tmdb_tv(tv_id_shifted, db, tmdb_client):
+    from requests.exceptions import HTTPError
     real_id = tv_id_shifted - 100000000
     try:
         tv = tmdb_client.get_tv_details(real_id)
@@ -200,354 +643,692 @@ def process_tmdb_tv(tv_id_shifted, db, tmdb_client):
         actors = ", ".join([cast_member.get("name", "") for cast_member in credits.get("cast", [])[:10] if cast_member.get("name")])
         
         movie_data = (tv_id_shifted, title, original_title, overview, rating, release_date, full_poster_url, genres, countries, directors, actors, 'tv')
-        db.upsert_movie(movie_data)
-        logging.info(f"Сохранен сериал ID {real_id}: {title}")
+        if db.upsert_movie(movie_data):
+            sampled("Сохранено сериалов", "Сохранен сериал ID %s: %s", real_id, title)
         return True
-    except requests.exceptions.HTTPError as e:
+    except HTTPError as e:
         if e.response.status_code == 404:
-            logging.info(f"Сериал ID {real_id} не найден. Пропускаем.")
+            sampled("Не найдено в TMDB", "Сериал ID %s не найден. Пропускаем.", real_id)
         else:
             logging.error(f"HTTP ошибка для сериала ID {real_id}: {e}")
     except Exception as e:
         logging.error(f"Ошибка при обработке сериала ID {real_id}: {e}")
     return False
 
-def main():
-    parser = argparse.ArgumentParser(description="Movies Parser")
-    parser.add_argument('--mode', choices=['tmdb', 'rutracker', 'nnmclub', 'cron', 'trends'], required=True, help='Режим работы парсера')
-    args = parser.parse_args()
+_title_index_lock = threading.Lock()
 
-    config = get_config()
-    update_progress("Инициализация", 0, 100)
-    logging.info(f"--- Запуск парсера фильмов (Режим: {args.mode}) ---")
-    
-    flag_path = os.path.join(DATA_DIR, 'stop.flag')
-    if os.path.exists(flag_path):
-        try:
-            os.remove(flag_path)
-        except OSError:
-            pass
+def ensure_title_index(db):
+    """
+    Строит нечеткий индекс названий из таблицы movies (один раз на процесс, даже если трекеры идут параллельно),
+    а при следующих задачах догружает фильмы, записанные с прошлой синхронизации: прогретый воркер
+    иначе не увидел бы фильмов, добавленных другими воркерами или запуском из консоли.
+    """
+    with _title_index_lock:
+        synced_at = db.current_timestamp()
+        if db.title_index is None:
+            from title_index import TitleIndex
+            started = time.time()
+            db.title_index = TitleIndex.build(db.iter_titles_for_index())
+            logging.info(f"Индекс названий построен: {len(db.title_index)} записей за {time.time() - started:.1f} с")
+        else:
+            before = len(db.title_index)
+            for row in db.iter_titles_for_index(updated_since=db.title_index.synced_at):
+                db.title_index.add(*row)
+            if len(db.title_index) > before:
+                logging.info(f"Индекс названий дополнен: {len(db.title_index) - before} новых записей")
+        db.title_index.synced_at = synced_at
+    return db.title_index
 
+@profiled('трекеры: сопоставление с фильмом')
+def match_topic_movie(db, tmdb_client, ru_title, orig_title, year, is_tv=False, log_prefix=""):
+    """
+    Сопоставляет раздачу с фильмом/сериалом: сначала по локальной БД и нечеткому индексу названий,
+    затем поиском в TMDB (найденное сразу сохраняется в БД). Возвращает ID в БД или None.
+    """
+    movie_id = db.find_movie_by_title_and_year(ru_title, orig_title, year)
+    if movie_id:
+        return movie_id
+
+    if db.title_index is not None:
+        movie_id, score = db.title_index.match(ru_title, orig_title, year, media_type='tv' if is_tv else 'movie')
+        if movie_id:
+            return movie_id
+
+    search_title = orig_title if orig_title else ru_title
+    if not search_title:
+        return None
+
+    sampled("Поиск в TMDB", "%sВ БД не найдено, ищем в TMDB: %s (%s)", log_prefix, search_title, year)
     try:
-        # 1. Инициализация БД
+        if is_tv:
+            tmdb_id = tmdb_client.search_tv(search_title, year)
+            if tmdb_id:
+                shifted_id = tmdb_id + 100000000
+                if process_tmdb_tv(shifted_id, db, tmdb_client):
+                    return shifted_id
+        else:
+            tmdb_id = tmdb_client.search_movie(search_title, year)
+            if tmdb_id:
+                if process_tmdb_movie(tmdb_id, db, tmdb_client):
+                    return tmdb_id
+    except Exception as e:
+        logging.error(f"{log_prefix}Ошибка поиска в TMDB для {search_title}: {e}")
+    return None
+
+def replay_tracker_archive(db, tmdb_client, tracker, client, url_like, is_tv_forum, since, stop_event):
+    """
+    Повторно разбирает сохраненные в архиве страницы трекера без обращения к сети:
+    заново парсит заголовки, сопоставляет с фильмами и обновляет раздачи.
+    """
+    import http_archive
+    archive = http_archive.get_archive()
+
+    # Собираем последнее состояние каждого топика по всем архивным страницам списков
+    topics = {}
+    for url, fetched_at, content in archive.iter_responses(url_like, since):
+        forum_match = re.search(r'[?&]f=(\d+)', url)
+        if not forum_match:
+            continue
+        forum_id = int(forum_match.group(1))
         try:
-            db = MovieDatabase()
-            logging.info("[1/3] База данных инициализирована.")
+            page_topics = client.parse_forum_page(content)
         except Exception as e:
-            logging.error(f"Ошибка при инициализации БД: {e}")
-            sys.exit(1)
+            logging.error(f"Ошибка разбора архивной страницы {url}: {e}")
+            continue
+        for topic in page_topics:
+            topic['forum_id'] = forum_id
+            topics[topic['topic_id']] = topic
 
-        run_tmdb = args.mode == 'tmdb' or (args.mode == 'cron' and config.get("run_tmdb", True))
-        run_rutracker = args.mode == 'rutracker' or (args.mode == 'cron' and config.get("run_rutracker", True))
-        run_nnmclub = args.mode == 'nnmclub' or (args.mode == 'cron' and config.get("run_nnmclub", True))
-        run_trends = args.mode == 'trends' or run_tmdb
+    logging.info(f"{tracker}: в архиве {len(topics)} топиков для повторной обработки")
+    updated = 0
+    for idx, topic in enumerate(topics.values(), 1):
+        if stop_event.is_set(): break
+        update_progress(f"Повторная обработка {tracker}", idx, len(topics), source=tracker)
+        try:
+            ru_title, orig_title, year = client.parse_topic_title(topic['title'])
+            movie_id = match_topic_movie(db, tmdb_client, ru_title, orig_title, year, is_tv=is_tv_forum(topic['forum_id']))
+            if not movie_id:
+                continue
 
-        # 1.5 Инициализация TMDB клиента
-        tmdb_client = TMDBClient()
-        if not tmdb_client.read_token and not tmdb_client.api_key:
-            logging.error("Ошибка: API ключи TMDB не найдены в файле .env. Пожалуйста, заполните их.")
-            sys.exit(1)
-
-        # 2. Обработка TMDB (полная база)
-        if run_tmdb:
-            logging.info("[2/3] Получение списков ID фильмов и сериалов...")
-            try:
-                local_ids = db.get_existing_ids()
-                
-                tmdb_movie_ids = tmdb_client.download_daily_movie_ids()
-                ids_to_fetch_movies = tmdb_movie_ids - local_ids
-                
-                tmdb_tv_ids = tmdb_client.download_daily_tv_ids()
-                shifted_tv_ids = {tid + 100000000 for tid in tmdb_tv_ids}
-                ids_to_fetch_tv = shifted_tv_ids - local_ids
-                
-                ids_to_fetch = ids_to_fetch_movies.union(ids_to_fetch_tv)
-                logging.info(f"Новых фильмов: {len(ids_to_fetch_movies)}, новых сериалов: {len(ids_to_fetch_tv)}")
-            except Exception as e:
-                logging.error(f"Ошибка при получении списков ID: {e}")
-                sys.exit(1)
+            details = {}
+            entry = archive.latest(client.topic_url(topic['topic_id']))
+            if entry and entry[0] == 200:
+                details = client.parse_topic_details(entry[2])
+            release = release_parser.parse_release_title(topic['title'])
+            quality = details.get('quality') or release.quality
+            translation = details.get('translation') or release.translation
+
+            if db.is_torrent_exists(tracker, topic['topic_id']):
+                db.update_torrent_parsed(
+                    tracker, topic['topic_id'], movie_id, topic['title'], quality=quality,
+                    file_format=details.get('file_format'), translation=translation
+                )
+                updated += 1
+            elif details.get('magnet'):
+                db.insert_torrent(
+                    tracker=tracker, topic_id=topic['topic_id'], movie_id=movie_id, topic_title=topic['title'],
+                    size_gb=round(topic.get('size_gb') or details.get('size_gb', 0), 2),
+                    quality=quality or '', file_format=details.get('file_format') or '', translation=translation or '',
+                    magnet_link=details['magnet'], seeds=topic['seeds'], leeches=topic['leeches']
+                )
+                updated += 1
+        except Exception as e:
+            logging.error(f"Ошибка повторной обработки топика {topic['topic_id']}: {e}")
+    return updated
+
+class ParserSession:
+    """
+    БД и клиенты источников, которые живут дольше одного запуска: в воркерах менеджера задач
+    (job_manager) они остаются прогретыми между задачами. Создаются при первом обращении.
+    """
+
+    def __init__(self, db_name=os.path.join(DATA_DIR, "movies.db")):
+        self.db_name = db_name
+        self._db = None
+        self._tmdb = None
+        self._rutracker = None
+        self._nnmclub = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = MovieDatabase(self.db_name)
+            logging.info("База данных инициализирована.")
+        return self._db
 
-            # Обработка TMDB
-            if ids_to_fetch:
-                ids_to_process = list(ids_to_fetch)
-                logging.info(f"[3/3] Начинаем загрузку TMDB (всего {len(ids_to_process)} новых ID)...")
+    @property
+    def tmdb(self):
+        if self._tmdb is None:
+            from tmdb_client import TMDBClient
+            tmdb_client = TMDBClient()
+            if not tmdb_client.read_token and not tmdb_client.api_key:
+                raise RuntimeError("API ключи TMDB не найдены в файле .env. Пожалуйста, заполните их.")
+            self._tmdb = tmdb_client
+        return self._tmdb
 
-                saved_count = 0
-                total_tmdb = len(ids_to_process)
+    @property
+    def rutracker(self):
+        if self._rutracker is None:
+            from rutracker_client import RutrackerClient
+            self._rutracker = RutrackerClient()
+        return self._rutracker
+
+    @property
+    def nnmclub(self):
+        if self._nnmclub is None:
+            from nnmclub_client import NnmclubClient
+            self._nnmclub = NnmclubClient()
+        return self._nnmclub
+
+def watch_stop_flag(flag_path, stop_event, interval=1.0):
+    """Фоновый поток: переводит stop.flag (остановка запуска из консоли) в событие отмены."""
+    def watch():
+        while not stop_event.wait(interval):
+            if os.path.exists(flag_path):
+                stop_event.set()
+    threading.Thread(target=watch, daemon=True).start()
+
+def run_seeds(session, stop_event):
+    """Легкий режим: только сиды/личи известных раздач, без TMDB и сопоставления."""
+    db = session.db
+    update_progress("Обновление сидов", 0, 100)
+    logging.info("Обновление сидов и личей по спискам тем трекеров...")
+    try:
+        rutracker = session.rutracker
+        rutracker.login()
+        forum_ids = []
+        for cat_id in RUTRACKER_CATEGORIES:
+            forum_ids.extend(rutracker.get_forums_from_category(cat_id))
+        updated = refresh_tracker_seeds(db, "rutracker", rutracker, forum_ids, stop_event)
+        logging.info(f"Rutracker: обновлено раздач {updated}")
+    except Exception as e:
+        logging.error(f"Ошибка при обновлении сидов Rutracker: {e}")
+
+    try:
+        nnm = session.nnmclub
+        updated = refresh_tracker_seeds(db, "nnmclub", nnm, NNM_FORUMS + NNM_TV_FORUMS, stop_event)
+        nnm.save_session()
+        logging.info(f"NNM-Club: обновлено раздач {updated}")
+    except Exception as e:
+        logging.error(f"Ошибка при обновлении сидов NNM-Club: {e}")
+
+def run_replay(session, replay_days, run_rutracker, run_nnmclub, stop_event):
+    """Повторная обработка архива: только разбор и сопоставление, без сети."""
+    db, tmdb_client = session.db, session.tmdb
+    since = time.time() - replay_days * 86400
+    logging.info(f"Повторная обработка HTTP-архива за {replay_days} дн.")
+    ensure_title_index(db)
+    if run_rutracker:
+        rutracker = session.rutracker
+        try:
+            tv_forums = {int(f) for f in rutracker.get_forums_from_category(18)}
+        except Exception:
+            tv_forums = set()
+        updated = replay_tracker_archive(db, tmdb_client, "rutracker", rutracker, "%rutracker.org/forum/viewforum.php%",
+                                         lambda f_id: f_id in tv_forums, since, stop_event)
+        logging.info(f"Rutracker: обновлено раздач из архива: {updated}")
+    if run_nnmclub:
+        nnm = session.nnmclub
+        updated = replay_tracker_archive(db, tmdb_client, "nnmclub", nnm, "%nnmclub.to/forum/viewforum.php%",
+                                         lambda f_id: f_id in NNM_TV_FORUMS, since, stop_event)
+        logging.info(f"NNM-Club: обновлено раздач из архива: {updated}")
+
+@profiled('этап: TMDB backfill')
+def run_tmdb(session, stop_event):
+    """Загрузка новых фильмов и сериалов из ежедневных выгрузок ID TMDB."""
+    db, tmdb_client = session.db, session.tmdb
+    logging.info("[2/3] Получение списков ID фильмов и сериалов...")
+    try:
+        local_ids = db.get_existing_ids()
+        
+        tmdb_movie_ids = tmdb_client.download_daily_movie_ids()
+        ids_to_fetch_movies = tmdb_movie_ids - local_ids
+        
+        tmdb_tv_ids = tmdb_client.download_daily_tv_ids()
+        shifted_tv_ids = {tid + 100000000 for tid in tmdb_tv_ids}
+        ids_to_fetch_tv = shifted_tv_ids - local_ids
+        
+        ids_to_fetch = ids_to_fetch_movies.union(ids_to_fetch_tv)
+        logging.info(f"Новых фильмов: {len(ids_to_fetch_movies)}, новых сериалов: {len(ids_to_fetch_tv)}")
+    except Exception as e:
+        raise RuntimeError(f"Ошибка при получении списков ID: {e}") from e
+
+    if not ids_to_fetch:
+        logging.info("База фильмов TMDB актуальна.")
+        return
+
+    ids_to_process = list(ids_to_fetch)
+    logging.info(f"[3/3] Начинаем загрузку TMDB (всего {len(ids_to_process)} новых ID)...")
+
+    saved_count = 0
+    total_tmdb = len(ids_to_process)
+    
+    max_workers = 15
+    
+    def process_item(item_id, db, tmdb_client):
+        if item_id > 100000000:
+            return process_tmdb_tv(item_id, db, tmdb_client)
+        else:
+            return process_tmdb_movie(item_id, db, tmdb_client)
+            
+    import concurrent.futures
+    from tqdm import tqdm
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        active_tasks = set()
+        id_iterator = iter(ids_to_process)
+        
+        # Пул начинается с небольшого запаса задач
+        for _ in range(max_workers * 2):
+            try:
+                item_id = next(id_iterator)
+                active_tasks.add(executor.submit(process_item, item_id, db, tmdb_client))
+            except StopIteration:
+                break
+        
+        with tqdm(total=total_tmdb, desc="Парсинг TMDB") as pbar:
+            while active_tasks:
+                if stop_event.is_set():
+                    logging.info("Получен сигнал остановки, прерываем парсинг TMDB.")
+                    try:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                    except TypeError:
+                        executor.shutdown(wait=False) # Для старых версий Python
+                    break
                 
-                max_workers = 15
+                # Ждем завершения хотя бы одной задачи, или просыпаемся раз в секунду
+                done, active_tasks = concurrent.futures.wait(active_tasks, timeout=1.0, return_when=concurrent.futures.FIRST_COMPLETED)
                 
-                def process_item(item_id, db, tmdb_client):
-                    if item_id > 100000000:
-                        return process_tmdb_tv(item_id, db, tmdb_client)
-                    else:
-                        return process_tmdb_movie(item_id, db, tmdb_client)
-                        
-                import concurrent.futures
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    active_tasks = set()
-                    id_iterator = iter(ids_to_process)
-                    
-                    # Пул начинается с небольшого запаса задач
-                    for _ in range(max_workers * 2):
-                        try:
-                            item_id = next(id_iterator)
-                            active_tasks.add(executor.submit(process_item, item_id, db, tmdb_client))
-                        except StopIteration:
-                            break
-                    
-                    with tqdm(total=total_tmdb, desc="Парсинг TMDB") as pbar:
-                        while active_tasks:
-                            if os.path.exists(flag_path):
-                                logging.info("Получен сигнал остановки, прерываем парсинг TMDB.")
-                                try:
-                                    executor.shutdown(wait=False, cancel_futures=True)
-                                except TypeError:
-                                    executor.shutdown(wait=False) # Для старых версий Python
-                                break
-                            
-                            # Ждем завершения хотя бы одной задачи, или просыпаемся раз в секунду
-                            done, active_tasks = concurrent.futures.wait(active_tasks, timeout=1.0, return_when=concurrent.futures.FIRST_COMPLETED)
-                            
-                            for future in done:
-                                try:
-                                    if future.result():
-                                        saved_count += 1
-                                except Exception as e:
-                                    logging.error(f"Ошибка в потоке при обработке фильма/сериала: {e}")
-                                
-                                pbar.update(1)
-                                update_progress("Парсинг TMDB", pbar.n, total_tmdb)
-                                
-                                # Добавляем новую задачу в пул взамен завершенной
-                                try:
-                                    next_item_id = next(id_iterator)
-                                    active_tasks.add(executor.submit(process_item, next_item_id, db, tmdb_client))
-                                except StopIteration:
-                                    pass
-            else:
-                logging.info("База фильмов TMDB актуальна.")
-        else:
-            if args.mode != 'trends':
-                logging.info("Парсинг TMDB отключен (работает другой режим).")
-
-        # 2.5 Обработка трендов "Сейчас смотрят"
-        if run_trends:
-            if not os.path.exists(flag_path):
-                update_progress("Обновление 'Сейчас смотрят'", 0, 100)
-                logging.info("Получение списка 'Сейчас смотрят' (фильмы и сериалы)...")
-                try:
-                    now_playing_m = tmdb_client.get_now_playing_movies()
-                    trending_tv = tmdb_client.get_trending_tv_shows()
-                    
-                    # Сдвигаем ID сериалов
-                    shifted_tv_ids = [tid + 100000000 for tid in trending_tv]
-                    all_trending_ids = now_playing_m + shifted_tv_ids
+                for future in done:
+                    try:
+                        if future.result():
+                            saved_count += 1
+                    except Exception as e:
+                        logging.error(f"Ошибка в потоке при обработке фильма/сериала: {e}")
                     
-                    # Проверяем, есть ли эти фильмы в нашей базе, если нет - докачиваем
-                    local_ids = db.get_existing_ids()
-                    missing_ids = [mid for mid in all_trending_ids if mid not in local_ids]
+                    pbar.update(1)
+                    update_progress("Парсинг TMDB", pbar.n, total_tmdb, source="TMDB")
                     
-                    if missing_ids:
-                        logging.info(f"Докачиваем {len(missing_ids)} недостающих фильмов/сериалов для раздела трендов...")
-                        for mid in missing_ids:
-                            if mid > 100000000:
-                                process_tmdb_tv(mid, db, tmdb_client)
-                            else:
-                                process_tmdb_movie(mid, db, tmdb_client)
-                                
-                    # Обновляем таблицу
-                    db.update_now_playing_list(all_trending_ids)
-                    logging.info(f"Раздел 'Сейчас смотрят' обновлен. Всего: {len(all_trending_ids)} элементов.")
-                except Exception as e:
-                    logging.error(f"Ошибка при обновлении 'Сейчас смотрят': {e}")
+                    # Добавляем новую задачу в пул взамен завершенной
+                    try:
+                        next_item_id = next(id_iterator)
+                        active_tasks.add(executor.submit(process_item, next_item_id, db, tmdb_client))
+                    except StopIteration:
+                        pass
 
-        # 3. Полный прогон парсера Рутрекера
-        if run_rutracker and not os.path.exists(flag_path):
-            update_progress("Парсинг Rutracker", 0, 100)
-            logging.info("Запуск парсера Rutracker (режим сканирования форумов)...")
-            rutracker = RutrackerClient()
-            try:
-                rutracker.login()
-                target_categories = [2, 18] # 2 - Кино, 18 - Сериалы
-                
-                for cat_id in target_categories:
-                    if os.path.exists(flag_path): break
-                    
-                    logging.info(f"Сбор форумов для категории {cat_id}...")
-                    forum_ids = rutracker.get_forums_from_category(cat_id)
+    stats = tmdb_client.details_stats
+    if stats['count']:
+        logging.info(
+            f"TMDB детали: {stats['count']} ответов, в среднем {stats['bytes'] // stats['count']} байт, "
+            f"разбор {stats['parse_time'] * 1000 / stats['count']:.2f} мс"
+        )
+
+@profiled('этап: тренды')
+def run_trends(session, stop_event):
+    """Обновление раздела "Сейчас смотрят"."""
+    if stop_event.is_set():
+        return
+    db, tmdb_client = session.db, session.tmdb
+    update_progress("Обновление 'Сейчас смотрят'", 0, 100, source="TMDB")
+    logging.info("Получение списка 'Сейчас смотрят' (фильмы и сериалы)...")
+    try:
+        now_playing_m = tmdb_client.get_now_playing_movies()
+        trending_tv = tmdb_client.get_trending_tv_shows()
+        
+        # Сдвигаем ID сериалов
+        shifted_tv_ids = [tid + 100000000 for tid in trending_tv]
+        all_trending_ids = now_playing_m + shifted_tv_ids
+        
+        # Проверяем, есть ли эти фильмы в нашей базе, если нет - докачиваем
+        local_ids = db.get_existing_ids()
+        missing_ids = [mid for mid in all_trending_ids if mid not in local_ids]
+        
+        if missing_ids:
+            logging.info(f"Докачиваем {len(missing_ids)} недостающих фильмов/сериалов для раздела трендов...")
+            for mid in missing_ids:
+                if mid > 100000000:
+                    process_tmdb_tv(mid, db, tmdb_client)
+                else:
+                    process_tmdb_movie(mid, db, tmdb_client)
                     
-                    for forum_id in forum_ids:
-                        if os.path.exists(flag_path): break
-                        logging.info(f"Сканирование подраздела f={forum_id}...")
-                        
-                        # Смотрим первые 2 страницы (свежие раздачи)
-                        try:
-                            topics = rutracker.get_topics_from_forum(forum_id, pages=2)
-                        except Exception as e:
-                            logging.error(f"Ошибка при получении топиков форума {forum_id}: {e}")
-                            time.sleep(2)
-                            continue
-                        
-                        for topic in topics:
-                            if os.path.exists(flag_path): break
-                            
-                            try:
-                                topic_id = topic['topic_id']
-                                
-                                # Если топик уже есть - просто обновляем сиды без захода внутрь
-                                if db.is_torrent_exists("rutracker", topic_id):
-                                    db.update_torrent_seeds("rutracker", topic_id, topic['seeds'], topic['leeches'])
-                                    continue
-                                    
-                                ru_title, orig_title, year = rutracker.parse_topic_title(topic['title'])
-                                movie_id = db.find_movie_by_title_and_year(ru_title, orig_title, year)
-                                
-                                if not movie_id:
-                                    # Ищем в TMDB
-                                    search_title = orig_title if orig_title else ru_title
-                                    if search_title:
-                                        logging.info(f"В БД не найдено, ищем в TMDB: {search_title} ({year})")
-                                        try:
-                                            if cat_id == 18:
-                                                tmdb_id = tmdb_client.search_tv(search_title, year)
-                                                if tmdb_id:
-                                                    shifted_id = tmdb_id + 100000000
-                                                    if process_tmdb_tv(shifted_id, db, tmdb_client):
-                                                        movie_id = shifted_id
-                                            else:
-                                                tmdb_id = tmdb_client.search_movie(search_title, year)
-                                                if tmdb_id:
-                                                    if process_tmdb_movie(tmdb_id, db, tmdb_client):
-                                                        movie_id = tmdb_id
-                                        except Exception as e:
-                                            logging.error(f"Ошибка поиска в TMDB для {search_title}: {e}")
-
-                                if movie_id:
-                                    logging.info(f"Добавление раздачи: {ru_title} ({year}) -> ID БД: {movie_id}")
-                                    details = rutracker.get_topic_details(topic_id)
-                                    
-                                    if details and details.get('magnet'):
-                                        db.insert_torrent(
-                                            tracker="rutracker",
-                                            topic_id=topic_id,
-                                            movie_id=movie_id,
-                                            topic_title=topic['title'],
-                                            size_gb=round(details['size_gb'], 2),
-                                            quality=details.get('quality', ''),
-                                            file_format='', 
-                                            translation='', 
-                                            magnet_link=details['magnet'],
-                                            seeds=details.get('seeds', topic['seeds']),
-                                            leeches=details.get('leeches', topic['leeches'])
-                                        )
-                                    time.sleep(1.5)
-                            except Exception as e:
-                                logging.error(f"Ошибка при обработке топика {topic.get('topic_id', 'Unknown')}: {e}")
-                                time.sleep(2)
-                            
-            except Exception as e:
-                logging.error(f"Ошибка в главном цикле парсинга Rutracker: {e}")
-        else:
-            if run_rutracker:
-                logging.info("Парсинг Rutracker отменен из-за флага остановки.")
-            else:
-                logging.info("Парсинг Rutracker отключен или не запрошен в этом режиме.")
-
-        # --- Парсинг NNM-Club ---
-        if run_nnmclub and not os.path.exists(flag_path):
-            update_progress("Парсинг NNM-Club", 0, 100)
-            nnm = NnmclubClient()
-            logging.info("Авторизация отключена: парсинг в гостевом режиме.")
-            NNM_FORUMS = [
-                # Горячие новинки
-                218, 954,
-                # Классика кино и Старые фильмы до 90-х
-                319, 885, 910, 912,
-                # Зарубежное кино
-                225, 227, 1296, 1299, 682, 884
-            ]
-            NNM_TV_FORUMS = [
-                # Зарубежные сериалы
-                1344, 779, 1288, 787, 1141, 777, 786, 776, 785, 775, 
-                1265, 1242, 1140, 782, 773, 1142, 772, 771, 783, 1144, 
-                804, 1290, 1300, 784, 774, 922, 770, 780
-            ]
-            all_nnm_forums = NNM_FORUMS + NNM_TV_FORUMS
+        # Обновляем таблицу
+        db.update_now_playing_list(all_trending_ids)
+        logging.info(f"Раздел 'Сейчас смотрят' обновлен. Всего: {len(all_trending_ids)} элементов.")
+    except Exception as e:
+        logging.error(f"Ошибка при обновлении 'Сейчас смотрят': {e}")
+
+def run_rutracker(session, stop_event):
+    """Полный прогон парсера Рутрекера."""
+    db, tmdb_client = session.db, session.tmdb
+    update_progress("Парсинг Rutracker", 0, 100, source="Rutracker")
+    logging.info("Запуск парсера Rutracker (режим сканирования форумов)...")
+    rutracker = session.rutracker
+    try:
+        ensure_title_index(db)
+        rutracker.login()
+        for cat_id in RUTRACKER_CATEGORIES:
+            if stop_event.is_set(): break
+            
+            logging.info(f"Сбор форумов для категории {cat_id}...")
+            forum_ids = rutracker.get_forums_from_category(cat_id)
             
-            for idx, f_id in enumerate(all_nnm_forums):
-                if os.path.exists(flag_path): break
-                update_progress(f"NNM-Club: Форум {f_id}", idx, len(all_nnm_forums))
+            for idx, forum_id in enumerate(forum_ids):
+                if stop_event.is_set(): break
+                forum_task = f"Rutracker: категория {cat_id}, форум {forum_id} ({idx + 1}/{len(forum_ids)})"
+                update_progress(forum_task, idx, len(forum_ids), source="Rutracker")
+                due, pages, _, crawl_state = plan_forum_crawl(db, "rutracker", forum_id)
+                if not due:
+                    logging.info(f"Подраздел f={forum_id} обходился недавно, пропускаем.")
+                    continue
+                logging.info(f"Сканирование подраздела f={forum_id}...")
                 
+                # Рутрекер сортирует темы по последнему сообщению: поднятая старая тема может занять
+                # целую страницу, поэтому по topic_id листание не обрываем
+                crawl_started_at = time.time()
                 try:
-                    topics = nnm.get_topics_from_forum(f_id, pages=2)
+                    topics = rutracker.get_topics_from_forum(forum_id, pages=pages)
                 except Exception as e:
-                    logging.error(f"Ошибка при получении топиков NNM-Club форума {f_id}: {e}")
+                    logging.error(f"Ошибка при получении топиков форума {forum_id}: {e}")
                     time.sleep(2)
                     continue
-                    
-                for topic in topics:
-                    if os.path.exists(flag_path): break
+
+                # Данные новых топиков одним запросом к API вместо захода на каждую страницу
+                new_topic_ids = [t['topic_id'] for t in topics if not db.is_torrent_exists("rutracker", t['topic_id'])]
+                api_details = {}
+                if new_topic_ids:
+                    try:
+                        api_details = rutracker.get_topics_api_data(new_topic_ids)
+                    except Exception as e:
+                        logging.error(f"Ошибка API Rutracker для форума {forum_id}: {e}")
+                
+                processed_ids, failed = [], False
+                for topic_idx, topic in enumerate(topics, 1):
+                    if stop_event.is_set(): break
+                    update_progress(f"{forum_task}, топики", topic_idx, len(topics), source="Rutracker")
                     
                     try:
                         topic_id = topic['topic_id']
-                        if db.is_torrent_exists("nnmclub", topic_id):
-                            db.update_torrent_seeds("nnmclub", topic_id, topic['seeds'], topic['leeches'])
+                        
+                        # Если топик уже есть - просто обновляем сиды без захода внутрь
+                        if db.is_torrent_exists("rutracker", topic_id):
+                            db.update_torrent_seeds("rutracker", topic_id, topic['seeds'], topic['leeches'])
+                            processed_ids.append(topic_id)
                             continue
                             
-                        ru_title, orig_title, year = nnm.parse_topic_title(topic['title'])
-                        movie_id = db.find_movie_by_title_and_year(ru_title, orig_title, year)
-                        
-                        if not movie_id:
-                            # Ищем в TMDB
-                            search_title = orig_title if orig_title else ru_title
-                            if search_title:
-                                logging.info(f"NNM В БД не найдено, ищем в TMDB: {search_title} ({year})")
-                                try:
-                                    if f_id in NNM_TV_FORUMS:
-                                        tmdb_id = tmdb_client.search_tv(search_title, year)
-                                        if tmdb_id:
-                                            shifted_id = tmdb_id + 100000000
-                                            if process_tmdb_tv(shifted_id, db, tmdb_client):
-                                                movie_id = shifted_id
-                                    else:
-                                        tmdb_id = tmdb_client.search_movie(search_title, year)
-                                        if tmdb_id:
-                                            if process_tmdb_movie(tmdb_id, db, tmdb_client):
-                                                movie_id = tmdb_id
-                                except Exception as e:
-                                    logging.error(f"NNM Ошибка поиска в TMDB для {search_title}: {e}")
+                        release = release_parser.parse_release_title(topic['title'])
+                        ru_title, orig_title, year = release.ru_title, release.orig_title, release.year
+
+                        # Раздача с этим info hash уже есть (обычно с NNM-Club): фильм и размер известны,
+                        # без поиска в TMDB и без захода в топик
+                        details = api_details.get(topic_id)
+                        known = db.find_torrent_by_hash(details['info_hash']) if details and details.get('info_hash') else None
+                        if known:
+                            sampled("Копий раздач Rutracker", "Раздача %s уже известна (ID раздачи %s), добавлена как копия", topic_id, known['id'])
+                            db.insert_torrent(
+                                tracker="rutracker", topic_id=topic_id, movie_id=known['movie_id'], topic_title=topic['title'],
+                                size_gb=round(details.get('size_gb') or known['size_gb'] or 0, 2),
+                                quality=details.get('quality') or known['quality'] or '', file_format='',
+                                translation=release.translation or known['translation'] or '', magnet_link=details['magnet'],
+                                seeds=details.get('seeds', topic['seeds']), leeches=details.get('leeches', topic['leeches'])
+                            )
+                            processed_ids.append(topic_id)
+                            continue
+
+                        movie_id = match_topic_movie(db, tmdb_client, ru_title, orig_title, year, is_tv=(cat_id == 18))
 
                         if movie_id:
-                            logging.info(f"NNM Новая раздача: {ru_title} ({year}) -> ID БД: {movie_id}")
-                            details = nnm.get_topic_details(topic_id)
-                            if details:
+                            sampled("Новых раздач Rutracker", "Добавление раздачи: %s (%s) -> ID БД: %s", ru_title, year, movie_id)
+                            # Страницу топика открываем только если в API не хватило данных
+                            if not details or not details.get('magnet') or not details.get('size_gb'):
+                                details = rutracker.get_topic_details(topic_id)
+                                time.sleep(1.5)
+                            
+                            if details and details.get('magnet'):
                                 db.insert_torrent(
-                                    tracker="nnmclub", topic_id=topic_id, movie_id=movie_id,
-                                    topic_title=topic['title'], size_gb=round(topic.get('size_gb', details.get('size_gb', 0)), 2),
-                                    quality=details.get('quality', ''), file_format=details.get('file_format', ''), translation=details.get('translation', ''),
-                                    magnet_link=details.get('magnet', ''), seeds=topic['seeds'], leeches=topic['leeches']
+                                    tracker="rutracker",
+                                    topic_id=topic_id,
+                                    movie_id=movie_id,
+                                    topic_title=topic['title'],
+                                    size_gb=round(details['size_gb'], 2),
+                                    quality=details.get('quality') or release.quality or '',
+                                    file_format='', 
+                                    translation=release.translation or '', 
+                                    magnet_link=details['magnet'],
+                                    seeds=details.get('seeds', topic['seeds']),
+                                    leeches=details.get('leeches', topic['leeches'])
                                 )
-                        time.sleep(1)
+                        processed_ids.append(topic_id)
                     except Exception as e:
-                        logging.error(f"Ошибка на NNM-Club при обработке топика {topic.get('topic_id', 'Unknown')}: {e}")
+                        failed = True
+                        logging.error(f"Ошибка при обработке топика {topic.get('topic_id', 'Unknown')}: {e}")
                         time.sleep(2)
+
+                # Прерванный или неудачный проход не сдвигает отметку: форум обойдем заново
+                if failed or stop_event.is_set():
+                    logging.info(f"Обход подраздела f={forum_id} не завершен, состояние обхода не сохранено.")
+                else:
+                    record_forum_crawl(db, "rutracker", forum_id, crawl_state, processed_ids, crawl_started_at)
+                    
+    except Exception as e:
+        logging.error(f"Ошибка в главном цикле парсинга Rutracker: {e}")
+
+def run_nnmclub(session, stop_event):
+    """Парсинг NNM-Club."""
+    db, tmdb_client = session.db, session.tmdb
+    update_progress("Парсинг NNM-Club", 0, 100, source="NNM-Club")
+    nnm = session.nnmclub
+    logging.info("Авторизация отключена: парсинг в гостевом режиме.")
+    ensure_title_index(db)
+    all_nnm_forums = NNM_FORUMS + NNM_TV_FORUMS
+    
+    for idx, f_id in enumerate(all_nnm_forums):
+        if stop_event.is_set(): break
+        forum_task = f"NNM-Club: форум {f_id} ({idx + 1}/{len(all_nnm_forums)})"
+        update_progress(forum_task, idx, len(all_nnm_forums), source="NNM-Club")
+
+        due, pages, known_max, crawl_state = plan_forum_crawl(db, "nnmclub", f_id)
+        if not due:
+            logging.info(f"NNM форум {f_id} обходился недавно, пропускаем.")
+            continue
+        
+        crawl_started_at = time.time()
+        try:
+            topics = nnm.get_topics_from_forum(f_id, pages=pages, known_max_topic_id=known_max)
+        except Exception as e:
+            logging.error(f"Ошибка при получении топиков NNM-Club форума {f_id}: {e}")
+            time.sleep(2)
+            continue
+            
+        processed_ids, failed = [], False
+        for topic_idx, topic in enumerate(topics, 1):
+            if stop_event.is_set(): break
+            update_progress(f"{forum_task}, топики", topic_idx, len(topics), source="NNM-Club")
+            
+            try:
+                topic_id = topic['topic_id']
+                if db.is_torrent_exists("nnmclub", topic_id):
+                    db.update_torrent_seeds("nnmclub", topic_id, topic['seeds'], topic['leeches'])
+                    processed_ids.append(topic_id)
+                    continue
+                    
+                release = release_parser.parse_release_title(topic['title'])
+                ru_title, orig_title, year = release.ru_title, release.orig_title, release.year
+                movie_id = match_topic_movie(db, tmdb_client, ru_title, orig_title, year, is_tv=(f_id in NNM_TV_FORUMS), log_prefix="NNM ")
+
+                if movie_id:
+                    sampled("Новых раздач NNM-Club", "NNM Новая раздача: %s (%s) -> ID БД: %s", ru_title, year, movie_id)
+                    details = nnm.get_topic_details(topic_id)
+                    if details:
+                        db.insert_torrent(
+                            tracker="nnmclub", topic_id=topic_id, movie_id=movie_id,
+                            topic_title=topic['title'], size_gb=round(topic.get('size_gb', details.get('size_gb', 0)), 2),
+                            quality=details.get('quality') or release.quality or '', file_format=details.get('file_format', ''),
+                            translation=details.get('translation') or release.translation or '',
+                            magnet_link=details.get('magnet', ''), seeds=topic['seeds'], leeches=topic['leeches']
+                        )
+                processed_ids.append(topic_id)
+                time.sleep(1)
+            except Exception as e:
+                failed = True
+                logging.error(f"Ошибка на NNM-Club при обработке топика {topic.get('topic_id', 'Unknown')}: {e}")
+                time.sleep(2)
+
+        if failed or stop_event.is_set():
+            logging.info(f"Обход NNM форума {f_id} не завершен, состояние обхода не сохранено.")
         else:
-            if run_nnmclub:
-                logging.info("Парсинг NNM-Club отменен из-за флага остановки.")
-            else:
-                logging.info("Парсинг NNM-Club отключен или не запрошен в этом режиме.")
+            record_forum_crawl(db, "nnmclub", f_id, crawl_state, processed_ids, crawl_started_at)
+
+    nnm.save_session()
+
+def run_stage(name, func):
+    """Выполняет этап, записывая его длительность и ошибки в метрики."""
+    try:
+        with STAGE_DURATION.time(stage=name), profiler.span(f"этап: {name}"):
+            func()
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+
+def run_sources_concurrently(sources, stop_event):
+    """
+    Запускает источники одновременно: время ночного прогона - самый долгий источник, а не сумма.
+    Ошибка одного источника не останавливает остальные; stop_event отменяет все.
+    """
+    started = time.time()
+    logging.info(f"Параллельный запуск источников: {', '.join(name for name, _ in sources)}")
+
+    def run_source(name, func):
+        source_started = time.time()
+        run_stage(name, func)
+        return time.time() - source_started
+
+    with ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="source") as executor:
+        futures = {executor.submit(run_source, name, func): name for name, func in sources}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                elapsed = future.result()
+                status = "остановлен" if stop_event.is_set() else "завершен"
+                logging.info(f"Источник {name} {status} за {elapsed:.0f} с")
+            except Exception as e:
+                logging.error(f"Ошибка источника {name}: {e}")
+            update_progress(f"{name}: готово", 1, 1, source=name)
+    logging.info(f"Все источники обработаны за {time.time() - started:.0f} с")
+
+def run_job(mode, session, stop_event, replay_days=None, export=True):
+    """
+    Один запуск парсера в режиме mode. stop_event - любое событие с is_set()
+    (threading.Event при запуске из консоли, multiprocessing.Event в воркерах менеджера задач).
+    При export=True после работы выгружает базу для клиентов.
+    """
+    config = get_config()
+    update_progress("Инициализация", 0, 100)
+    logging.info(f"--- Запуск парсера фильмов (Режим: {mode}) ---")
+
+    try:
+        import_stage_modules(mode)
+
+        # 1. Инициализация БД
+        session.db
+
+        run_tmdb_stage = mode == 'tmdb' or (mode == 'cron' and config.get("run_tmdb", True))
+        run_rutracker_stage = mode == 'rutracker' or (mode == 'cron' and config.get("run_rutracker", True))
+        run_nnmclub_stage = mode == 'nnmclub' or (mode == 'cron' and config.get("run_nnmclub", True))
+        run_trends_stage = mode == 'trends' or run_tmdb_stage
+
+        if mode == 'seeds':
+            run_stage("seeds", lambda: run_seeds(session, stop_event))
+            return
+
+        # 1.5 Инициализация TMDB клиента
+        session.tmdb
+
+        if replay_days is not None:
+            run_stage("replay", lambda: run_replay(session, replay_days, run_rutracker_stage, run_nnmclub_stage, stop_event))
+            return
+
+        def tmdb_stages():
+            # 2. Обработка TMDB (полная база), 2.5 - тренды "Сейчас смотрят" (тот же API, те же лимиты)
+            if run_tmdb_stage:
+                run_tmdb(session, stop_event)
+            if run_trends_stage:
+                run_trends(session, stop_event)
+
+        # Источники: (название, функция). Каждый ходит на свой хост со своими задержками,
+        # запись в БД общая (MovieDatabase сериализует ее через db_lock)
+        sources = []
+        if run_tmdb_stage or run_trends_stage:
+            sources.append(("TMDB", tmdb_stages))
+        else:
+            logging.info("Парсинг TMDB отключен (работает другой режим).")
+        if run_rutracker_stage:
+            sources.append(("Rutracker", lambda: run_rutracker(session, stop_event)))
+        else:
+            logging.info("Парсинг Rutracker отключен или не запрошен в этом режиме.")
+        if run_nnmclub_stage:
+            sources.append(("NNM-Club", lambda: run_nnmclub(session, stop_event)))
+        else:
+            logging.info("Парсинг NNM-Club отключен или не запрошен в этом режиме.")
+
+        if mode == 'cron' and len(sources) > 1:
+            run_sources_concurrently(sources, stop_event)
+        else:
+            for name, run_source in sources:
+                if stop_event.is_set():
+                    logging.info(f"Парсинг {name} отменен из-за флага остановки.")
+                    continue
+                run_stage(name, run_source)
 
     finally:
-        # 4. Архивация базы данных всегда выполняется
-        create_zip(db.db_name if 'db' in locals() else "movies.db")
+        # 4. Архивация базы данных (кроме воспроизведения архива - оно не ходит в сеть)
+        if export and replay_days is None:
+            export_database(session.db_name)
+        parser_logging.flush_sampled()
+        logging.info("--- Работа скрипта завершена ---")
+        progress.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description="Movies Parser")
+    parser.add_argument('--mode', choices=['tmdb', 'rutracker', 'nnmclub', 'cron', 'trends', 'seeds'], required=True, help='Режим работы парсера')
+    parser.add_argument('--replay', nargs='?', const=30, type=int, metavar='DAYS',
+                        help='Повторно обработать ответы из HTTP-архива за последние DAYS дней (по умолчанию 30) без обращения к сети')
+    parser.add_argument('--profile', nargs='?', const='spans', choices=['spans', 'sample'],
+                        help='Замерить время этапов и горячих функций (sample - еще и сэмплирование стеков всех потоков); '
+                             'отчет пишется в data/profiles')
+    args = parser.parse_args()
+    setup_logging()
+    metrics.start_publisher('cli')
+    if args.profile:
+        profiler.enable(sample=args.profile == 'sample')
+    if args.replay is not None:
+        import http_archive
+        http_archive.enable_replay()
+
+    flag_path = os.path.join(DATA_DIR, 'stop.flag')
+    if os.path.exists(flag_path):
+        try:
+            os.remove(flag_path)
+        except OSError:
+            pass
+    stop_event = threading.Event()
+    watch_stop_flag(flag_path, stop_event)
+
+    progress.start(f"cli-{os.getpid()}", args.mode)
+    try:
+        run_job(args.mode, ParserSession(), stop_event, replay_days=args.replay)
+    except Exception as e:
+        logging.error(f"Ошибка: {e}")
+        sys.exit(1)
+    finally:
+        stop_event.set()
+        progress.finish()
+        report_path = profiler.write_report(args.mode)
+        if report_path:
+            logging.info(f"Отчет профилирования: {report_path}")
         if os.path.exists(flag_path):
             try:
                 os.remove(flag_path)
             except OSError:
                 pass
-        logging.info("--- Работа скрипта завершена ---")
-        update_progress("Ожидание", 0, 0)
 
 if __name__ == "__main__":
     main()
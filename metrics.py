@@ -0,0 +1,291 @@
+"""
+Метрики в стиле Prometheus без внешних зависимостей: счетчики и гистограммы с метками.
+
+Процессы парсера (консольный запуск и воркеры менеджера задач) периодически сбрасывают снимок
+своего реестра в METRICS_DIR/<процесс>.json, web_app отдает их вместе со своими метриками на /metrics.
+"""
+import os
+import re
+import json
+import time
+import atexit
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+METRICS_DIR = os.environ.get("METRICS_DIR", "data/metrics")
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Числа в пути URL (кроме первого сегмента - версии API) заменяем, чтобы /3/movie/550 и /3/movie/551 были одним endpoint
+PATH_ID_RE = re.compile(r'(?<=.)/\d+(?=/|$)')
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # метки -> [счетчики по корзинам..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), list(state)] for key, state in self._values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        """Состояние реестра в виде, пригодном для json."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        result = {}
+        for metric in metrics:
+            entry = {'type': metric.type, 'help': metric.help, 'labels': list(metric.labelnames), 'samples': metric.samples()}
+            if metric.type == 'histogram':
+                entry['buckets'] = list(metric.buckets)
+            result[metric.name] = entry
+        return result
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'parser_http_requests_total', 'HTTP-запросы к источникам', ('source', 'endpoint', 'status'))
+HTTP_DURATION = REGISTRY.histogram(
+    'parser_http_request_duration_seconds', 'Время ответа источников', ('source', 'endpoint'))
+DB_DURATION = REGISTRY.histogram(
+    'parser_db_operation_duration_seconds', 'Время операций с БД', ('operation',))
+STAGE_DURATION = REGISTRY.histogram(
+    'parser_stage_duration_seconds', 'Длительность этапов парсера', ('stage',),
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200, 14400))
+STAGE_ERRORS = REGISTRY.counter(
+    'parser_stage_errors_total', 'Ошибки этапов парсера', ('stage',))
+EXPORT_DURATION = REGISTRY.histogram(
+    'parser_export_duration_seconds', 'Шаги выгрузки базы', ('step',),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600))
+UPLOAD_BYTES = REGISTRY.counter(
+    'parser_upload_bytes_total', 'Загружено в R2, байт', ('result',))
+WEB_REQUESTS = REGISTRY.counter(
+    'web_requests_total', 'Запросы к веб-интерфейсу', ('endpoint', 'status'))
+WEB_DURATION = REGISTRY.histogram(
+    'web_request_duration_seconds', 'Время обработки запросов веб-интерфейса', ('endpoint',))
+
+
+def timed(histogram, **labels):
+    """Декоратор: время выполнения функции в гистограмму."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def endpoint_of(url):
+    return PATH_ID_RE.sub('/{id}', urlsplit(url).path) or '/'
+
+
+def instrument_session(session, source):
+    """
+    Хук requests: число ответов по статусам (429 - троттлинг) и время ответа по endpoint.
+    Ошибки соединения и таймауты ответа не дают, поэтому считаются оберткой session.request
+    со статусом "error" (время - до ошибки).
+    """
+    from requests import RequestException
+
+    def record(response, *args, **kwargs):
+        endpoint = endpoint_of(response.request.url)
+        HTTP_REQUESTS.inc(source=source, endpoint=endpoint, status=response.status_code)
+        if response.elapsed:
+            HTTP_DURATION.observe(response.elapsed.total_seconds(), source=source, endpoint=endpoint)
+    session.hooks['response'].append(record)
+
+    send_request = session.request
+    # cloudscraper повторяет запрос через self.request - ошибку считаем один раз, во внешнем вызове
+    nesting = threading.local()
+
+    @wraps(send_request)
+    def request(method, url, *args, **kwargs):
+        outer = not getattr(nesting, 'active', False)
+        nesting.active = True
+        started_at = time.perf_counter()
+        try:
+            return send_request(method, url, *args, **kwargs)
+        except RequestException:
+            if outer:
+                endpoint = endpoint_of(url)
+                HTTP_REQUESTS.inc(source=source, endpoint=endpoint, status='error')
+                HTTP_DURATION.observe(time.perf_counter() - started_at, source=source, endpoint=endpoint)
+            raise
+        finally:
+            if outer:
+                nesting.active = False
+    session.request = request
+    return session
+
+
+# --- Публикация из процессов парсера ---
+
+_publisher_name = None
+
+
+def flush():
+    """Сбрасывает снимок реестра процесса в METRICS_DIR (атомарно)."""
+    if not _publisher_name:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{_publisher_name}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'process': _publisher_name, 'updated_at': time.time(), 'metrics': REGISTRY.snapshot()}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def start_publisher(name, interval=10):
+    """
+    Запускает фоновую публикацию метрик процесса под именем name (cli, worker-0, ...).
+    Процесс с тем же именем после перезапуска начинает счетчики заново - Prometheus считает это сбросом.
+    """
+    global _publisher_name
+    if _publisher_name:
+        return
+    _publisher_name = name
+
+    def publish():
+        while True:
+            time.sleep(interval)
+            flush()
+    threading.Thread(target=publish, daemon=True, name="metrics-publisher").start()
+    atexit.register(flush)
+
+
+# --- Вывод в текстовом формате Prometheus ---
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in pairs) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(snapshots):
+    """snapshots - список (имя процесса, снимок реестра). Возвращает текст для /metrics."""
+    merged = {}
+    for process, snapshot in snapshots:
+        for name, entry in snapshot.items():
+            merged.setdefault(name, (entry, []))[1].append((process, entry))
+
+    lines = []
+    for name in sorted(merged):
+        meta, entries = merged[name]
+        lines.append(f"# HELP {name} {meta['help']}")
+        lines.append(f"# TYPE {name} {meta['type']}")
+        for process, entry in entries:
+            extra = (('process', process),)
+            for label_values, value in entry['samples']:
+                if entry['type'] == 'counter':
+                    lines.append(f"{name}{_labels(entry['labels'], label_values, extra)} {_format_number(value)}")
+                    continue
+                # Корзины накопительные (observe увеличивает все корзины с границей >= значения)
+                for bound, count in zip(entry['buckets'], value):
+                    le = (('le', _format_number(float(bound))),)
+                    lines.append(f"{name}_bucket{_labels(entry['labels'], label_values, extra + le)} {count}")
+                count = value[-1]
+                lines.append(f"{name}_bucket{_labels(entry['labels'], label_values, extra + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_labels(entry['labels'], label_values, extra)} {_format_number(value[-2])}")
+                lines.append(f"{name}_count{_labels(entry['labels'], label_values, extra)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def collect(own_process='web'):
+    """Снимки всех процессов парсера из METRICS_DIR плюс реестр текущего процесса."""
+    snapshots = [(own_process, REGISTRY.snapshot())]
+    try:
+        names = sorted(os.listdir(METRICS_DIR))
+    except OSError:
+        names = []
+    for file_name in names:
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, file_name), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            snapshots.append((data['process'], data['metrics']))
+        except (OSError, ValueError, KeyError):
+            continue
+    return snapshots
@@ -1,7 +1,10 @@
 import cloudscraper
 from bs4 import BeautifulSoup
+from session_store import SessionStore
 
 s = cloudscraper.create_scraper()
+store = SessionStore("nnmclub", max_age=24 * 3600)
+store.load(s)
 targets = {
     'Горячие новинки': 216,
     'Классика кино': 318,
@@ -18,5 +21,7 @@ for name, fid in targets.items():
         if 'f=' in href:
             res.append(f"{a.text.strip()} -> {href}")
 
+store.save(s)
+
 with open('subforums.txt', 'w', encoding='utf-8') as f:
     f.write('\n'.join(res))
@@ -0,0 +1,109 @@
+"""
+Логирование парсера: потоки пишут записи в очередь (QueueHandler) и не ждут диска, в файл их пишет
+один QueueListener с ротацией по размеру. Воркеры менеджера задач отправляют записи в очередь
+процесса web_app, так что файл лога ротирует один процесс.
+
+Сообщения о каждом элементе (сохранен фильм, новая раздача, поиск в TMDB) пишутся через sampled():
+первые LOG_SAMPLE_FIRST за окно LOG_SUMMARY_INTERVAL, об остальных - одна сводная строка.
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from queue import Queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_PATH = os.path.join('data', 'parser.log')
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+# Сколько предыдущих файлов хранить (parser.log.1 ... parser.log.N)
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 5))
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+LOG_SAMPLE_FIRST = 20
+LOG_SUMMARY_INTERVAL = 60.0
+
+
+def _install(handler):
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def start_listener(log_queue=None):
+    """
+    Запускает запись в LOG_PATH с ротацией из очереди log_queue (по умолчанию - очередь этого процесса,
+    в которую направляется и корневой логгер). Возвращает (очередь, listener).
+    """
+    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    file_handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    own_queue = log_queue is None
+    if own_queue:
+        log_queue = Queue()
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    if own_queue:
+        _install(QueueHandler(log_queue))
+    return log_queue, listener
+
+
+def connect(log_queue):
+    """Направляет корневой логгер процесса в чужую очередь (воркеры менеджера задач)."""
+    _install(QueueHandler(log_queue))
+
+
+class SampledLog:
+    """Ограничивает частоту однотипных сообщений: по ключу не больше first строк за interval секунд."""
+
+    def __init__(self, first=LOG_SAMPLE_FIRST, interval=LOG_SUMMARY_INTERVAL):
+        self.first = first
+        self.interval = interval
+        self._windows = {}  # ключ -> [начало окна, всего сообщений, записано в лог]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _summary(key, window, now):
+        total, logged = window[1], window[2]
+        if total <= logged:
+            return None
+        return f"{key}: {total} за {now - window[0]:.0f} с (в лог записано {logged})"
+
+    def log(self, key, msg, *args, level=logging.INFO):
+        """Сообщение msg % args; строка форматируется, только если попадает в лог."""
+        now = time.monotonic()
+        summary = None
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = [now, 0, 0]
+            elif now - window[0] >= self.interval:
+                summary = self._summary(key, window, now)
+                window[:] = [now, 0, 0]
+            window[1] += 1
+            emit = window[2] < self.first
+            if emit:
+                window[2] += 1
+        if summary:
+            logging.info(summary)
+        if emit:
+            logging.log(level, msg, *args)
+
+    def flush(self):
+        """Сводка по незакрытым окнам (конец запуска)."""
+        now = time.monotonic()
+        with self._lock:
+            summaries = [self._summary(key, window, now) for key, window in self._windows.items()]
+            self._windows.clear()
+        for summary in summaries:
+            if summary:
+                logging.info(summary)
+
+
+_sampled = SampledLog()
+sampled = _sampled.log
+flush_sampled = _sampled.flush
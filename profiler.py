@@ -0,0 +1,194 @@
+"""
+Профилирование запуска парсера (main.py --profile): интервалы по этапам и горячим функциям,
+по желанию - сэмплирующий профайлер по всем потокам. Отчет о каждом запуске пишется в PROFILE_DIR.
+Пока профилирование не включено, span() стоит одну проверку флага.
+"""
+import os
+import sys
+import json
+import time
+import threading
+from functools import wraps
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "data/profiles")
+# Сколько последних отчетов хранить
+MAX_REPORTS = 30
+SAMPLE_INTERVAL = 0.01
+TOP_FUNCTIONS = 40
+
+_enabled = False
+_spans = {}  # имя -> [количество, суммарное время, максимум]
+_spans_lock = threading.Lock()
+_sampler = None
+_started_at = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def _record(name, elapsed):
+    with _spans_lock:
+        stat = _spans.get(name)
+        if stat is None:
+            _spans[name] = [1, elapsed, elapsed]
+        else:
+            stat[0] += 1
+            stat[1] += elapsed
+            if elapsed > stat[2]:
+                stat[2] = elapsed
+
+
+@contextmanager
+def span(name):
+    """Интервал с именем name. Вложенные и параллельные интервалы считаются независимо."""
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - started)
+
+
+def profiled(name):
+    """Декоратор: каждый вызов функции - интервал name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class Sampler:
+    """
+    Сэмплирующий профайлер: раз в interval снимает стеки всех потоков (sys._current_frames).
+    self - функция на вершине стека, inclusive - функция где-либо в стеке.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = Counter()
+        self.inclusive_counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler-sampler")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.samples += 1
+                self.self_counts[self._label(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    label = self._label(frame)
+                    if label not in seen:
+                        seen.add(label)
+                        self.inclusive_counts[label] += 1
+                    frame = frame.f_back
+
+    @staticmethod
+    def _label(frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def report(self):
+        return {
+            'interval': self.interval,
+            'samples': self.samples,
+            'top_self': self.self_counts.most_common(TOP_FUNCTIONS),
+            'top_inclusive': self.inclusive_counts.most_common(TOP_FUNCTIONS),
+        }
+
+
+def enable(sample=False):
+    """Включает сбор интервалов (и сэмплирование стеков при sample=True)."""
+    global _enabled, _sampler, _started_at
+    _enabled = True
+    _started_at = time.time()
+    if sample:
+        _sampler = Sampler()
+        _sampler.start()
+
+
+def write_report(mode):
+    """Пишет отчет запуска в PROFILE_DIR и удаляет старые. Возвращает путь к отчету или None."""
+    global _enabled, _sampler
+    if not _enabled:
+        return None
+    _enabled = False
+    finished_at = time.time()
+    if _sampler is not None:
+        _sampler.stop()
+
+    with _spans_lock:
+        spans = [
+            {'name': name, 'count': count, 'total': round(total, 4), 'max': round(max_time, 4)}
+            for name, (count, total, max_time) in _spans.items()
+        ]
+        _spans.clear()
+    spans.sort(key=lambda s: s['total'], reverse=True)
+
+    report = {
+        'mode': mode,
+        'started_at': _started_at,
+        'finished_at': finished_at,
+        'wall_time': round(finished_at - _started_at, 3),
+        'spans': spans,
+        'sampling': _sampler.report() if _sampler is not None else None,
+    }
+    _sampler = None
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = time.strftime('%Y%m%d-%H%M%S', time.localtime(_started_at)) + f"_{mode}.json"
+    path = os.path.join(PROFILE_DIR, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+
+    for old_name in list_reports()[MAX_REPORTS:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old_name))
+        except OSError:
+            pass
+    return path
+
+
+def list_reports():
+    """Имена файлов отчетов, от новых к старым."""
+    try:
+        return sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith('.json')), reverse=True)
+    except OSError:
+        return []
+
+
+def load_reports(limit=5):
+    reports = []
+    for name in list_reports()[:limit]:
+        try:
+            with open(os.path.join(PROFILE_DIR, name), 'r', encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        report['file'] = name
+        reports.append(report)
+    return reports
@@ -0,0 +1,204 @@
+"""
+Разбор заголовков раздач обоих трекеров за один проход.
+Все регулярные выражения компилируются один раз при импорте, результаты кешируются.
+"""
+import re
+import base64
+import binascii
+from collections import namedtuple
+from functools import lru_cache
+
+ReleaseInfo = namedtuple('ReleaseInfo', [
+    'ru_title', 'orig_title', 'year', 'quality', 'resolution', 'source',
+    'codec', 'hdr', 'translation', 'size_gb', 'is_dvd'
+])
+
+# Rutracker: Зеленая миля / The Green Mile (Фрэнк Дарабонт) [1999, США, BDRip]
+# Год должен стоять в скобках целиком ([1999, / [2019-2021, / [1999]), иначе [1080p] NNM-Club читался бы как год
+RUTRACKER_TITLE_RE = re.compile(r'^(.+?)(?:\s+/\s+(.+?))?(?:\s+\(.*\))?\s+\[(\d{4})(?=\s*[,\]\-–])')
+# NNM-Club: Зеленая миля / The Green Mile (1999) BDRip 1080p
+NNMCLUB_TITLE_RE = re.compile(r'^(.+?)(?:\s+/\s+(.+?))?(?:\s+/\s+.*?)?\s*\((\d{4})(?:-\d{4})?\)')
+
+DVD_RE = re.compile(r'DVD(-?Video|5|9)', re.IGNORECASE)
+# Последнее значение в квадратных скобках: [1999, США, BDRip 1080p]
+BRACKET_QUALITY_RE = re.compile(r'\[[^\]]+,\s*([^,\]]+)\]')
+RESOLUTION_RE = re.compile(r'\b(2160p|1080p|1080i|720p|576p|480p|4K|UHD)\b', re.IGNORECASE)
+SOURCE_RE = re.compile(
+    r'\b(BDRemux|Blu-?ray|BDRip|HDRip|WEB-?DLRip|WEB-?DL|WEB-?Rip|HDTVRip|HDTV|DVDRip|TVRip|SATRip|CAMRip)\b',
+    re.IGNORECASE
+)
+CODEC_RE = re.compile(r'\b(HEVC|H\.?265|x265|AVC|H\.?264|x264|XviD|DivX|AV1)\b', re.IGNORECASE)
+HDR_RE = re.compile(r'\b(HDR10\+?|HDR|Dolby\s?Vision|DV)\b', re.IGNORECASE)
+TRANSLATION_RE = re.compile(
+    r'\b(Dub|MVO|DVO|AVO|VO|Sub|Subs|Original|Дубляж|Дублированный|Многоголосый|Двухголосый|Одноголосый|Авторский|Оригинал)\b',
+    re.IGNORECASE
+)
+# NNM-Club после "|" перечисляет переводы буквами: D, P, P2, A, L, O, Sub (за ними бывают и другие
+# сегменты: "| D | Лицензия"), поэтому берется последний сегмент, в котором есть известный код
+NNM_TRANSLATION_SEGMENT_RE = re.compile(r'\|([^|]*)')
+LETTER_SPLIT_RE = re.compile(r'[,\s]+')
+NNM_TRANSLATION_LETTERS = {'D': 'Dub', 'P': 'MVO', 'P2': 'DVO', 'L': 'VO', 'A': 'AVO', 'O': 'Original', 'SUB': 'Sub'}
+# Info hash в магнет-ссылке: 40 hex-символов или 32 символа base32
+INFO_HASH_RE = re.compile(r'urn:btih:([0-9A-Fa-f]{40}|[A-Za-z2-7]{32})(?![0-9A-Za-z])')
+SIZE_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*(TB|ТБ|GB|ГБ|MB|МБ)', re.IGNORECASE)
+
+TRANSLATION_NAMES = {
+    'dub': 'Dub', 'дубляж': 'Dub', 'дублированный': 'Dub',
+    'mvo': 'MVO', 'многоголосый': 'MVO',
+    'dvo': 'DVO', 'двухголосый': 'DVO',
+    'avo': 'AVO', 'авторский': 'AVO',
+    'vo': 'VO', 'одноголосый': 'VO',
+    'sub': 'Sub', 'subs': 'Sub',
+    'original': 'Original', 'оригинал': 'Original',
+}
+
+
+def parse_size_gb(text):
+    """Размер в гигабайтах из строки вида '1.46 GB' / '700 МБ'. 0.0, если размер не найден."""
+    if not text:
+        return 0.0
+    match = SIZE_RE.search(text)
+    if not match:
+        return 0.0
+    val = float(match.group(1).replace(',', '.'))
+    unit = match.group(2).upper()
+    if unit in ('TB', 'ТБ'):
+        return val * 1024
+    if unit in ('MB', 'МБ'):
+        return val / 1024
+    return val
+
+
+def is_dvd(title):
+    return bool(DVD_RE.search(title))
+
+
+def _parse_translation(title):
+    names = []
+    for match in TRANSLATION_RE.finditer(title):
+        name = TRANSLATION_NAMES[match.group(1).lower()]
+        if name not in names:
+            names.append(name)
+
+    for segment in reversed(NNM_TRANSLATION_SEGMENT_RE.findall(title)):
+        codes = [NNM_TRANSLATION_LETTERS.get(code.upper()) for code in LETTER_SPLIT_RE.split(segment.strip())]
+        codes = [name for name in codes if name]
+        if codes:
+            for name in codes:
+                if name not in names:
+                    names.append(name)
+            break
+    return ", ".join(names) or None
+
+
+@lru_cache(maxsize=65536)
+def parse_release_title(title):
+    """Разбирает заголовок раздачи в ReleaseInfo (названия, год, качество, перевод, размер)."""
+    title = title or ""
+    ru_title, orig_title, year = None, None, None
+    match = RUTRACKER_TITLE_RE.search(title) or NNMCLUB_TITLE_RE.search(title)
+    if match:
+        ru_title = match.group(1).strip()
+        orig_title = match.group(2).strip() if match.group(2) else ""
+        year = match.group(3)
+
+    resolution = RESOLUTION_RE.search(title)
+    source = SOURCE_RE.search(title)
+    codec = CODEC_RE.search(title)
+    hdr = HDR_RE.search(title)
+    resolution = resolution.group(1) if resolution else None
+    source = source.group(1) if source else None
+
+    bracket = BRACKET_QUALITY_RE.search(title)
+    if bracket:
+        quality = bracket.group(1).strip()
+    else:
+        quality = " ".join(p for p in (source, resolution) if p) or None
+
+    return ReleaseInfo(
+        ru_title=ru_title,
+        orig_title=orig_title,
+        year=year,
+        quality=quality,
+        resolution=resolution,
+        source=source,
+        codec=codec.group(1) if codec else None,
+        hdr=hdr.group(1) if hdr else None,
+        translation=_parse_translation(title),
+        size_gb=parse_size_gb(title),
+        is_dvd=is_dvd(title),
+    )
+
+
+def parse_info_hash(magnet):
+    """Info hash из магнет-ссылки в виде 40 hex-символов в нижнем регистре. None, если его нет."""
+    if not magnet:
+        return None
+    match = INFO_HASH_RE.search(magnet)
+    if not match:
+        return None
+    value = match.group(1)
+    if len(value) == 32:
+        try:
+            value = base64.b32decode(value.upper()).hex()
+        except (binascii.Error, ValueError):
+            return None
+    return value.lower()
+
+
+def parse_release_titles(titles):
+    """Пакетный вариант parse_release_title."""
+    return [parse_release_title(t) for t in titles]
+
+
+# Заголовки, на которых парсер ошибался; проверяются через python release_parser.py --check
+SAMPLE_TITLES = [
+    ("Зеленая миля / The Green Mile (Фрэнк Дарабонт) [1999, США, BDRip]",
+     {'ru_title': "Зеленая миля", 'orig_title': "The Green Mile", 'year': "1999", 'quality': "BDRip"}),
+    ("Игра престолов / Game of Thrones [2011-2019, США, WEB-DL 1080p]",
+     {'ru_title': "Игра престолов", 'orig_title': "Game of Thrones", 'year': "2011"}),
+    ("Зеленая миля / The Green Mile (1999) BDRip 1080p | D",
+     {'ru_title': "Зеленая миля", 'orig_title': "The Green Mile", 'year': "1999", 'translation': "Dub"}),
+    ("Дюна / Dune (2021) WEB-DL [1080p]",
+     {'ru_title': "Дюна", 'orig_title': "Dune", 'year': "2021", 'resolution': "1080p"}),
+    ("Дюна / Dune (2021) WEB-DL [2160p] HDR | P2",
+     {'ru_title': "Дюна", 'orig_title': "Dune", 'year': "2021", 'resolution': "2160p", 'translation': "DVO"}),
+    ("Дюна / Dune (2021) WEB-DLRip [1080p] | D | Лицензия",
+     {'ru_title': "Дюна", 'orig_title': "Dune", 'year': "2021", 'translation': "Dub"}),
+]
+
+
+def check_samples():
+    """Сверяет разбор SAMPLE_TITLES с ожидаемыми полями. Возвращает список расхождений."""
+    errors = []
+    for title, expected in SAMPLE_TITLES:
+        release = parse_release_title(title)
+        for field, value in expected.items():
+            if getattr(release, field) != value:
+                errors.append(f"{title}: {field} = {getattr(release, field)!r}, ожидалось {value!r}")
+    return errors
+
+
+if __name__ == "__main__":
+    # Замер пропускной способности на заголовках из БД: python release_parser.py [data/movies.db]
+    # Проверка разбора на SAMPLE_TITLES: python release_parser.py --check
+    import sys
+    import time
+    import sqlite3
+
+    if "--check" in sys.argv[1:]:
+        problems = check_samples()
+        for problem in problems:
+            print(problem)
+        print(f"Заголовков: {len(SAMPLE_TITLES)}, расхождений: {len(problems)}")
+        sys.exit(1 if problems else 0)
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else "data/movies.db"
+    with sqlite3.connect(db_path) as conn:
+        titles = [row[0] for row in conn.execute("SELECT topic_title FROM torrents WHERE topic_title IS NOT NULL")]
+
+    started = time.perf_counter()
+    parse_release_titles(titles)
+    elapsed = time.perf_counter() - started
+    parsed = sum(1 for t in titles if parse_release_title(t).year)
+    print(f"{len(titles)} заголовков за {elapsed:.3f} с ({len(titles) / max(elapsed, 1e-9):.0f}/с), с годом: {parsed}")
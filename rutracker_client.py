@@ -3,20 +3,48 @@ import requests
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import re
+from urllib.parse import quote
+from session_store import SessionStore, cache_get, cache_set
+import http_archive
+import metrics
+from profiler import profiled
+import release_parser
 
 load_dotenv()
 
 class RutrackerClient:
+    # Публичный JSON API (адрес можно переопределить, например, на локальную заглушку)
+    API_URL = os.environ.get("RUTRACKER_API_URL", "https://api.rutracker.cc/v1")
+    API_BATCH_SIZE = 100
+    ANNOUNCE_URL = "http://bt.t-ru.org/ann?magnet"
+
     def __init__(self):
-        self.session = requests.Session()
+        self.session = metrics.instrument_session(http_archive.setup_session(requests.Session()), 'rutracker')
         self.session.headers.update({
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
         })
         self.login_username = os.environ.get("RUTRACKER_LOGIN")
         self.login_password = os.environ.get("RUTRACKER_PASSWORD")
+        self.session_store = SessionStore("rutracker")
+        self.forums_cache_ttl = int(os.environ.get("RUTRACKER_FORUMS_CACHE_TTL", 24 * 3600))
+
+    def is_logged_in(self):
+        """Проверяет, что текущие cookies дают авторизованную сессию."""
+        response = self.session.get("https://rutracker.org/forum/index.php")
+        response.raise_for_status()
+        return 'profile.php?mode=viewprofile' in response.text
 
     def login(self):
-        """Авторизация на Rutracker"""
+        """Авторизация на Rutracker (повторно используем сохраненную сессию, пока она жива)"""
+        if self.session_store.load(self.session):
+            try:
+                if self.is_logged_in():
+                    return True
+            except Exception:
+                pass
+            self.session.cookies.clear()
+            self.session_store.clear()
+
         if not self.login_username or not self.login_password:
             raise ValueError("Rutracker credentials are not set in the environment variables.")
 
@@ -31,6 +59,7 @@ class RutrackerClient:
         response.raise_for_status()
         
         if 'bb_session' in self.session.cookies or 'profile.php?mode=viewprofile' in response.text:
+            self.session_store.save(self.session)
             return True
         return False
 
@@ -117,6 +146,10 @@ class RutrackerClient:
 
     def get_forums_from_category(self, category_id):
         """Собирает ID всех подразделов (форумов) из указанной категории (например, Кино = 2)."""
+        cached = cache_get(f"rutracker_forums_{category_id}", self.forums_cache_ttl)
+        if cached:
+            return cached
+
         url = f"https://rutracker.org/forum/index.php?c={category_id}"
         response = self.session.get(url)
         response.raise_for_status()
@@ -129,14 +162,24 @@ class RutrackerClient:
             if href and 'viewforum.php?f=' in href:
                 forum_id = href.split('f=')[-1]
                 forum_ids.append(forum_id)
-        return list(set(forum_ids)) # Убираем дубликаты
+        forum_ids = list(set(forum_ids)) # Убираем дубликаты
+        cache_set(f"rutracker_forums_{category_id}", forum_ids)
+        return forum_ids
 
+    def topic_url(self, topic_id):
+        return f"https://rutracker.org/forum/viewtopic.php?t={topic_id}"
+
+    @profiled('rutracker: страница топика')
     def get_topic_details(self, topic_id):
         """Заходит в топик и собирает магнит, сиды, личи и размер."""
-        url = f"https://rutracker.org/forum/viewtopic.php?t={topic_id}"
-        response = self.session.get(url)
+        response = self.session.get(self.topic_url(topic_id))
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'lxml')
+        return self.parse_topic_details(response.text)
+
+    @profiled('rutracker: разбор топика')
+    def parse_topic_details(self, html):
+        """Разбирает страницу топика (html - текст или сырые байты ответа)."""
+        soup = BeautifulSoup(html, 'lxml')
         
         details = {
             'magnet': None, 'size_gb': 0.0, 'seeds': 0, 'leeches': 0,
@@ -157,83 +200,131 @@ class RutrackerClient:
         # Размер файла
         size_span = soup.find("span", id="tor-size-humn")
         if size_span:
-            raw_size = size_span.text.replace('\xa0', ' ').replace('&nbsp;', ' ').strip()
-            match = re.search(r'([\d\.]+)\s*([A-Za-zА-Яа-я]+)', raw_size)
-            if match:
-                val = float(match.group(1))
-                unit = match.group(2).upper()
-                if unit in ['GB', 'ГБ']: details['size_gb'] = val
-                elif unit in ['MB', 'МБ']: details['size_gb'] = val / 1024.0
+            details['size_gb'] = release_parser.parse_size_gb(size_span.text)
                 
-        # Качество берем из заголовка как резерв (последнее значение в скобках [])
+        # Качество и перевод берем из заголовка как резерв
         title_tag = soup.select_one('h1.maintitle a')
         if title_tag:
-            q_match = re.search(r'\[[^\]]+,\s*([^,\]]+)\]', title_tag.text)
-            if q_match: details['quality'] = q_match.group(1).strip()
+            release = release_parser.parse_release_title(title_tag.text.strip())
+            details['quality'] = release.quality
+            details['translation'] = release.translation
             
         return details
 
+    def _api_get(self, method, topic_ids):
+        url = f"{self.API_URL}/{method}"
+        params = {"by": "topic_id", "val": ",".join(str(tid) for tid in topic_ids)}
+        response = self.session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        return response.json().get("result") or {}
+
+    @profiled('rutracker: API')
+    def get_topics_api_data(self, topic_ids):
+        """
+        Пакетно получает через API магнет (по info hash), размер, сиды и личи
+        для списка топиков - по одному запросу на каждые 100 ID вместо загрузки страницы каждого топика.
+        Возвращает словарь {topic_id: details}; топики без данных в API в него не попадают.
+        """
+        result = {}
+        topic_ids = [int(tid) for tid in topic_ids]
+        for i in range(0, len(topic_ids), self.API_BATCH_SIZE):
+            chunk = topic_ids[i:i + self.API_BATCH_SIZE]
+            topic_data = self._api_get("get_tor_topic_data", chunk)
+            peer_stats = self._api_get("get_peer_stats", chunk)
+
+            for tid in chunk:
+                data = topic_data.get(str(tid))
+                if not data:
+                    continue
+                info_hash = data.get("info_hash")
+                details = {
+                    'info_hash': info_hash.lower() if info_hash else None,
+                    # В адресе анонсера свой '?', без кодирования строгие разборщики магнетов ломаются
+                    'magnet': f"magnet:?xt=urn:btih:{info_hash}&tr={quote(self.ANNOUNCE_URL, safe='')}" if info_hash else None,
+                    'size_gb': (data.get("size") or 0) / 1024 ** 3,
+                    'seeds': data.get("seeders") or 0,
+                    'leeches': 0,
+                    'quality': release_parser.parse_release_title(data.get("topic_title") or "").quality,
+                }
+                # get_peer_stats: [сиды, личи, время последнего сида]
+                stats = peer_stats.get(str(tid))
+                if stats:
+                    details['seeds'] = stats[0] or 0
+                    details['leeches'] = stats[1] or 0
+                result[tid] = details
+        return result
+
     def parse_topic_title(self, title):
         """
         Извлекает русское название, оригинальное название и год из стандартного заголовка Rutracker.
         Пример: Зеленая миля / The Green Mile (Фрэнк Дарабонт) [1999, США, BDRip]
         """
-        # Регулярное выражение для поиска названий и года в квадратных скобках
-        match = re.search(r'^(.+?)(?:\s+/\s+(.+?))?(?:\s+\(.*\))?\s+\[(\d{4})', title)
-        if match:
-            ru_title = match.group(1).strip()
-            # Если оригинального названия нет, group(2) будет None
-            orig_title = match.group(2).strip() if match.group(2) else ""
-            year = match.group(3)
-            return ru_title, orig_title, year
-        return None, None, None
+        release = release_parser.parse_release_title(title)
+        return release.ru_title, release.orig_title, release.year
 
+    @profiled('rutracker: списки тем')
     def get_topics_from_forum(self, forum_id, pages=1):
+        """
+        Собирает топики с первых `pages` страниц форума.
+        Темы отсортированы по последнему сообщению, поэтому страница из старых topic_id
+        не означает, что дальше нет новых - листаем все `pages` страниц.
+        """
         topics = []
         for page in range(pages):
             start = page * 50
             url = f"https://rutracker.org/forum/viewforum.php?f={forum_id}&start={start}"
             response = self.session.get(url)
             response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'lxml')
+            page_topics = self.parse_forum_page(response.text)
+
+            topics.extend(page_topics)
+            if not page_topics:
+                break
+        return topics
+
+    @profiled('rutracker: разбор списка тем')
+    def parse_forum_page(self, html):
+        """Разбирает страницу списка тем форума в список топиков с сидами и личами."""
+        soup = BeautifulSoup(html, 'lxml')
+        
+        # Находим разделитель "Темы"
+        separator = soup.find(lambda tag: tag.name == 'td' and 'topicSep' in tag.get('class', []) and 'Темы' in tag.text)
+        
+        if separator:
+            trs = separator.parent.find_next_siblings('tr', class_='hl-tr')
+        else:
+            trs = soup.select('tr.hl-tr')
             
-            # Находим разделитель "Темы"
-            separator = soup.find(lambda tag: tag.name == 'td' and 'topicSep' in tag.get('class', []) and 'Темы' in tag.text)
+        topics = []
+        for row in trs:
+            a_tag = row.select_one('a.tt-text')
+            if not a_tag: continue
             
-            if separator:
-                trs = separator.parent.find_next_siblings('tr', class_='hl-tr')
-            else:
-                trs = soup.select('tr.hl-tr')
-                
-            for row in trs:
-                a_tag = row.select_one('a.tt-text')
-                if not a_tag: continue
+            title = a_tag.text.strip()
+            
+            # Фильтрация DVD форматов
+            if release_parser.is_dvd(title):
+                continue
                 
-                title = a_tag.text.strip()
+            href = a_tag.get('href')
+            if href and 'viewtopic.php?t=' in href:
+                topic_id = int(href.split('t=')[-1])
                 
-                # Фильтрация DVD форматов
-                if re.search(r'DVD(-?Video|5|9)', title, re.IGNORECASE):
-                    continue
-                    
-                href = a_tag.get('href')
-                if href and 'viewtopic.php?t=' in href:
-                    topic_id = int(href.split('t=')[-1])
+                seeds, leeches = 0, 0
+                seed_tag = row.find(class_=re.compile(r'seedmed')) or row.find(title="Сиды")
+                if seed_tag:
+                    s_text = re.sub(r'\D', '', seed_tag.text)
+                    if s_text: seeds = int(s_text)
                     
-                    seeds, leeches = 0, 0
-                    seed_tag = row.find(class_=re.compile(r'seedmed')) or row.find(title="Сиды")
-                    if seed_tag:
-                        s_text = re.sub(r'\D', '', seed_tag.text)
-                        if s_text: seeds = int(s_text)
-                        
-                    leech_tag = row.find(class_=re.compile(r'leechmed')) or row.find(title="Личи")
-                    if leech_tag:
-                        l_text = re.sub(r'\D', '', leech_tag.text)
-                        if l_text: leeches = int(l_text)
-                    
-                    topics.append({
-                        'topic_id': topic_id,
-                        'title': title,
-                        'seeds': seeds,
-                        'leeches': leeches
-                    })
+                leech_tag = row.find(class_=re.compile(r'leechmed')) or row.find(title="Личи")
+                if leech_tag:
+                    l_text = re.sub(r'\D', '', leech_tag.text)
+                    if l_text: leeches = int(l_text)
+                
+                topics.append({
+                    'topic_id': topic_id,
+                    'title': title,
+                    'seeds': seeds,
+                    'leeches': leeches
+                })
         return topics
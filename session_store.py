@@ -0,0 +1,81 @@
+import os
+import json
+import time
+
+SESSION_DIR = os.environ.get("SESSION_DIR", "data/sessions")
+
+
+class SessionStore:
+    """
+    Сохраняет cookies сессии трекера на диск (включая cf_clearance от Cloudflare),
+    чтобы короткие запуски не логинились и не проходили проверку заново.
+    """
+
+    def __init__(self, name, max_age=7 * 24 * 3600):
+        self.path = os.path.join(SESSION_DIR, f"{name}.json")
+        self.max_age = max_age
+
+    def load(self, session):
+        """Восстанавливает cookies в session. Возвращает False, если сохранения нет или оно устарело."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if time.time() - data.get('saved_at', 0) > self.max_age:
+            return False
+
+        now = time.time()
+        restored = 0
+        for c in data.get('cookies', []):
+            if c.get('expires') and c['expires'] < now:
+                continue
+            session.cookies.set(c['name'], c['value'], domain=c.get('domain', ''), path=c.get('path', '/'),
+                                expires=c.get('expires'), secure=c.get('secure', False))
+            restored += 1
+        return restored > 0
+
+    def save(self, session):
+        cookies = [
+            {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path,
+             'expires': c.expires, 'secure': c.secure}
+            for c in session.cookies
+        ]
+        try:
+            os.makedirs(SESSION_DIR, exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'saved_at': time.time(), 'cookies': cookies}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def cache_get(key, ttl):
+    """Возвращает закешированное значение, если оно моложе ttl секунд, иначе None."""
+    try:
+        with open(os.path.join(SESSION_DIR, f"cache_{key}.json"), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - data.get('saved_at', 0) > ttl:
+        return None
+    return data.get('value')
+
+
+def cache_set(key, value):
+    try:
+        os.makedirs(SESSION_DIR, exist_ok=True)
+        path = os.path.join(SESSION_DIR, f"cache_{key}.json")
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'saved_at': time.time(), 'value': value}, f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
@@ -0,0 +1,28 @@
+"""Время импорта по режимам парсера укладывается в бюджет (import_benchmark.MODE_BUDGET_MS)."""
+import pytest
+
+import import_benchmark
+from import_benchmark import MODE_BUDGET_MS
+
+pytest.importorskip("dotenv")
+
+import main
+
+
+def test_every_mode_has_a_budget():
+    assert set(MODE_BUDGET_MS) == {'main'} | set(main.STAGE_MODULES)
+
+
+def test_main_does_not_import_stage_modules():
+    imports = import_benchmark.top_level_imports("import main")
+    heavy = {name.split('.')[0] for modules in main.STAGE_MODULES.values() for name in modules}
+    assert not heavy & {name.split('.')[0] for name in imports}
+
+
+@pytest.mark.parametrize("mode", list(MODE_BUDGET_MS))
+def test_import_budget(mode):
+    try:
+        elapsed = import_benchmark.measure(mode)
+    except ModuleNotFoundError as e:
+        pytest.skip(f"не установлена зависимость режима {mode}: {e}")
+    assert elapsed <= MODE_BUDGET_MS[mode], f"{mode}: {elapsed:.1f} мс при бюджете {MODE_BUDGET_MS[mode]} мс"
@@ -0,0 +1,83 @@
+"""Пакетный API Рутрекера против локальной заглушки (RutrackerClient.API_URL)."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("bs4")
+pytest.importorskip("dotenv")
+
+from rutracker_client import RutrackerClient
+
+INFO_HASH = "0123456789ABCDEF0123456789ABCDEF01234567"
+
+API_RESPONSES = {
+    "get_tor_topic_data": {
+        "1001": {
+            "info_hash": INFO_HASH,
+            "size": 3 * 1024 ** 3,
+            "seeders": 7,
+            "topic_title": "Зеленая миля / The Green Mile (Фрэнк Дарабонт) [1999, США, BDRip 1080p]",
+        },
+        "1002": None,
+    },
+    # [сиды, личи, время последнего сида]
+    "get_peer_stats": {"1001": [42, 5, 1700000000]},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        method = url.path.rsplit("/", 1)[-1]
+        self.requests.append((method, parse_qs(url.query)))
+        body = json.dumps({"result": API_RESPONSES.get(method, {})}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api_url():
+    server = HTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubHandler.requests.clear()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def test_topics_api_data(api_url):
+    client = RutrackerClient()
+    client.API_URL = api_url
+
+    result = client.get_topics_api_data([1001, 1002])
+
+    assert set(result) == {1001}
+    details = result[1001]
+    assert details["info_hash"] == INFO_HASH.lower()
+    assert details["size_gb"] == pytest.approx(3.0)
+    assert (details["seeds"], details["leeches"]) == (42, 5)
+    assert details["quality"] == "BDRip 1080p"
+
+    magnet = details["magnet"]
+    assert magnet.startswith(f"magnet:?xt=urn:btih:{INFO_HASH}&tr=")
+    # Адрес анонсера закодирован целиком: в магнете один '?' и ни одного лишнего параметра
+    assert magnet.count("?") == 1
+    tracker = parse_qs(urlsplit(magnet).query)["tr"]
+    assert [unquote(t) for t in tracker] == [RutrackerClient.ANNOUNCE_URL]
+
+    methods = [method for method, _ in StubHandler.requests]
+    assert methods == ["get_tor_topic_data", "get_peer_stats"]
+    assert StubHandler.requests[0][1] == {"by": ["topic_id"], "val": ["1001,1002"]}
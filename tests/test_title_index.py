@@ -0,0 +1,14 @@
+from title_index import normalize_title
+
+
+def test_cyrillic_preposition_is_not_a_roman_numeral():
+    assert normalize_title("Любовь в большом городе") == ['lyubov', 'v', 'bolshom', 'gorode']
+
+
+def test_latin_roman_numerals_become_digits():
+    assert normalize_title("Rocky IV") == ['rocky', '4']
+    assert normalize_title("Звёздные войны: Эпизод V")[-1] == '5'
+
+
+def test_number_words_in_any_alphabet():
+    assert normalize_title("Часть вторая") == normalize_title("Часть 2") == ['2']
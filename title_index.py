@@ -0,0 +1,150 @@
+import re
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+
+# Транслитерация, чтобы "Терминатор" и "Terminator" давали одинаковые токены
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+# Римские цифры приводим к арабским только в словах, написанных латиницей: после транслитерации
+# предлог "в" дал бы 'v' -> 5 ("Любовь в большом городе")
+ROMAN_NUMERALS = {
+    'ii': '2', 'iii': '3', 'iv': '4', 'v': '5', 'vi': '6', 'vii': '7', 'viii': '8', 'ix': '9', 'x': '10',
+}
+# Числительные (в т.ч. транслит русских порядковых) - в любом алфавите
+NUMBER_WORDS = {
+    'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5',
+    'pervaya': '1', 'vtoraya': '2', 'tretya': '3', 'chetvertaya': '4', 'pyataya': '5',
+    'dva': '2', 'tri': '3',
+}
+
+WORD_SPLIT_RE = re.compile(r'[^a-z0-9а-яё]+')
+
+# Слова, которые часто есть в одном варианте названия и отсутствуют в другом
+STOP_WORDS = {'the', 'a', 'an', 'and', 'i', 'chast', 'part', 'film', 'sezon', 'season'}
+
+# Токены с таким числом фильмов в одном году почти ничего не говорят о совпадении
+MAX_POSTING_SIZE = 5000
+# Сколько кандидатов с наибольшим числом общих токенов сравнивать посимвольно
+MAX_CANDIDATES = 50
+
+
+def normalize_title(title):
+    """Приводит название к списку токенов: нижний регистр, транслит, арабские цифры, без служебных слов."""
+    if not title:
+        return []
+    tokens = []
+    for word in WORD_SPLIT_RE.split(title.lower()):
+        token = word.translate(TRANSLIT)
+        if not token:
+            continue
+        if token == word:
+            token = ROMAN_NUMERALS.get(token, token)
+        token = NUMBER_WORDS.get(token, token)
+        if token in STOP_WORDS:
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def _similarity(a_tokens, b_tokens):
+    """
+    Похожесть двух названий: максимум из пересечения множеств токенов, вхождения
+    одного названия в другое (подзаголовок) и посимвольного сравнения.
+    """
+    if not a_tokens or not b_tokens:
+        return 0.0
+    a_set, b_set = set(a_tokens), set(b_tokens)
+    common = len(a_set & b_set)
+    token_set = common / len(a_set | b_set)
+    # "Терминатор 2" и "Терминатор 2: Судный день" - одно название содержит другое целиком
+    shorter = min(len(a_set), len(b_set))
+    containment = 0.9 * common / shorter if shorter >= 2 else 0.0
+    chars = SequenceMatcher(None, ' '.join(sorted(a_set)), ' '.join(sorted(b_set))).ratio()
+    score = max(token_set, containment, chars)
+
+    # Разные номера частей - это разные фильмы
+    if {t for t in a_set if t.isdigit()} != {t for t in b_set if t.isdigit()}:
+        score *= 0.5
+    return score
+
+
+class TitleIndex:
+    """
+    Индекс названий фильмов в памяти: токены -> ID, с разбиением по году выпуска.
+    Позволяет сопоставить заголовок раздачи с фильмом без поиска в TMDB.
+    """
+
+    def __init__(self, threshold=0.85):
+        self.threshold = threshold
+        self._postings = {}  # (год, токен) -> список ID
+        self._titles = {}    # ID -> (год, тип, токены названия, токены оригинального названия)
+        self._lock = threading.Lock()
+        # Момент, до которого в индексе учтены строки movies (для догрузки записанного другими процессами)
+        self.synced_at = None
+
+    @classmethod
+    def build(cls, rows, threshold=0.85):
+        """rows - итерируемое (id, title, original_title, release_date, media_type)."""
+        index = cls(threshold)
+        for row in rows:
+            index.add(*row)
+        return index
+
+    def __len__(self):
+        return len(self._titles)
+
+    def add(self, movie_id, title, original_title, release_date, media_type='movie'):
+        year = str(release_date)[:4] if release_date else ""
+        if not year.isdigit():
+            return
+        year = int(year)
+        title_tokens = normalize_title(title)
+        orig_tokens = normalize_title(original_title)
+
+        with self._lock:
+            if movie_id in self._titles:
+                return
+            self._titles[movie_id] = (year, media_type, title_tokens, orig_tokens)
+            for token in set(title_tokens) | set(orig_tokens):
+                self._postings.setdefault((year, token), []).append(movie_id)
+
+    def match(self, ru_title, orig_title, year, media_type=None):
+        """
+        Ищет лучший фильм того же года (±1). Возвращает (movie_id, score),
+        или (None, score), если уверенность ниже порога.
+        """
+        if not year or not str(year).isdigit():
+            return None, 0.0
+        year = int(year)
+        queries = [q for q in (normalize_title(orig_title), normalize_title(ru_title)) if q]
+        if not queries:
+            return None, 0.0
+
+        hits = Counter()
+        for tokens in queries:
+            for token in set(tokens):
+                for y in (year, year - 1, year + 1):
+                    posting = self._postings.get((y, token))
+                    if posting and (len(posting) <= MAX_POSTING_SIZE or len(tokens) == 1):
+                        hits.update(posting)
+
+        best_id, best_score = None, 0.0
+        for movie_id, _ in hits.most_common(MAX_CANDIDATES):
+            c_year, c_type, c_title, c_orig = self._titles[movie_id]
+            if media_type and c_type != media_type:
+                continue
+            score = max(_similarity(q, c) for q in queries for c in (c_title, c_orig))
+            if c_year != year:
+                score *= 0.95
+            if score > best_score:
+                best_id, best_score = movie_id, score
+
+        if best_score >= self.threshold:
+            return best_id, best_score
+        return None, best_score
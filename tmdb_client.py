@@ -4,10 +4,58 @@ import datetime
 import gzip
 import json
 import io
+import time
+import logging
+import threading
 from dotenv import load_dotenv
+import http_archive
+import metrics
+from profiler import profiled
 
 load_dotenv()
 
+def parse_details_lean(raw, cast_limit=10, crew_job=b'Director'):
+    """
+    Разбирает ответ деталей с append_to_response=credits, не создавая Python-объекты для
+    лишних участников: из cast декодируются первые cast_limit элементов, из crew - только
+    записи с должностью crew_job (None - crew не нужен). Границы ищутся поиском по байтам;
+    если ответ устроен не так, как ожидается, бросает ValueError.
+    """
+    body = raw.rstrip()
+    key = body.rfind(b'"credits":{')
+    # TMDB отдает компактный JSON, а присоединенные credits идут последним полем
+    if key == -1 or not body.endswith(b']}}'):
+        raise ValueError("unexpected credits layout")
+
+    credits_raw = body[key + len(b'"credits":'):-1]
+    cast_start = credits_raw.find(b'"cast":[')
+    crew_start = credits_raw.find(b'"crew":[')
+    if cast_start == -1 or crew_start == -1 or credits_raw[crew_start - 2:crew_start] != b'],':
+        raise ValueError("unexpected credits layout")
+
+    cast_raw = credits_raw[cast_start + len(b'"cast":'):crew_start - 1]
+    head_end = -1
+    for _ in range(cast_limit):
+        head_end = cast_raw.find(b'},{', head_end + 1)
+        if head_end == -1:
+            break
+    cast = json.loads(cast_raw if head_end == -1 else cast_raw[:head_end + 1] + b']')
+
+    crew = []
+    if crew_job:
+        crew_raw = credits_raw[crew_start + len(b'"crew":'):-1]
+        marker = b'"job":"' + crew_job + b'"'
+        idx = crew_raw.find(marker)
+        while idx != -1:
+            element_start = crew_raw.rfind(b'{', 0, idx)
+            element_end = crew_raw.find(b'}', idx) + 1
+            crew.append(json.loads(crew_raw[element_start:element_end]))
+            idx = crew_raw.find(marker, element_end)
+
+    data = json.loads(body[:key] + b'"credits":null}')
+    data['credits'] = {'cast': cast, 'crew': crew}
+    return data
+
 class TMDBClient:
     BASE_URL = "https://api.themoviedb.org/3"
     IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
@@ -15,6 +63,10 @@ class TMDBClient:
     def __init__(self):
         self.api_key = os.environ.get("TMDB_API_KEY")
         self.read_token = os.environ.get("TMDB_READ_TOKEN")
+        self.session = metrics.instrument_session(http_archive.setup_session(requests.Session()), 'tmdb')
+        # Суммарная статистика загрузки деталей (объем ответов и время разбора)
+        self.details_stats = {'count': 0, 'bytes': 0, 'parse_time': 0.0}
+        self._stats_lock = threading.Lock()
         
         if not self.read_token:
              # Если v4 токен не задан, попробуем использовать v3 API Key в заголовках (хотя v4 предпочтительнее)
@@ -27,6 +79,7 @@ class TMDBClient:
                 "Authorization": f"Bearer {self.read_token}"
             }
 
+    @profiled('tmdb: выгрузка ID')
     def download_daily_movie_ids(self):
         """
         Скачивает архив ID фильмов за вчерашний день и возвращает множество ID.
@@ -46,6 +99,7 @@ class TMDBClient:
                 
         return movie_ids
 
+    @profiled('tmdb: выгрузка ID')
     def download_daily_tv_ids(self):
         yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
         date_str = yesterday.strftime("%m_%d_%Y")
@@ -58,6 +112,7 @@ class TMDBClient:
                 tv_ids.add(json.loads(line).get("id"))
         return tv_ids
 
+    @profiled('tmdb: детали')
     def get_movie_details(self, movie_id):
         """
         Получает детальную информацию о конкретном фильме вместе с участниками (credits).
@@ -71,23 +126,41 @@ class TMDBClient:
         if not self.read_token and self.api_key:
             params["api_key"] = self.api_key
 
-        response = requests.get(url, headers=self.headers, params=params, timeout=15)
+        response = self.session.get(url, headers=self.headers, params=params, timeout=15)
         response.raise_for_status()
-        return response.json()
+        return self._parse_details(response.content, f"movie/{movie_id}")
 
+    @profiled('tmdb: детали')
     def get_tv_details(self, tv_id):
         url = f"{self.BASE_URL}/tv/{tv_id}"
         params = {"language": "ru-RU", "append_to_response": "credits"}
         if not self.read_token and self.api_key: params["api_key"] = self.api_key
-        response = requests.get(url, headers=self.headers, params=params, timeout=15)
+        response = self.session.get(url, headers=self.headers, params=params, timeout=15)
         response.raise_for_status()
-        return response.json()
+        # Для сериалов режиссеры берутся из created_by, crew не нужен вовсе
+        return self._parse_details(response.content, f"tv/{tv_id}", crew_job=None)
+
+    def _parse_details(self, raw, label, crew_job=b'Director'):
+        started = time.perf_counter()
+        try:
+            data = parse_details_lean(raw, crew_job=crew_job)
+        except ValueError:
+            # Неожиданная структура credits - разбираем целиком
+            data = json.loads(raw)
+        parse_time = time.perf_counter() - started
+
+        with self._stats_lock:
+            self.details_stats['count'] += 1
+            self.details_stats['bytes'] += len(raw)
+            self.details_stats['parse_time'] += parse_time
+        logging.debug(f"TMDB {label}: {len(raw)} байт, разбор {parse_time * 1000:.2f} мс")
+        return data
 
     def get_now_playing_movies(self):
         url = f"{self.BASE_URL}/movie/now_playing"
         params = {"language": "ru-RU", "page": 1}
         if not self.read_token and self.api_key: params["api_key"] = self.api_key
-        response = requests.get(url, headers=self.headers, params=params, timeout=15)
+        response = self.session.get(url, headers=self.headers, params=params, timeout=15)
         response.raise_for_status()
         return [item['id'] for item in response.json().get('results', [])]
 
@@ -95,26 +168,28 @@ class TMDBClient:
         url = f"{self.BASE_URL}/trending/tv/week"
         params = {"language": "ru-RU"}
         if not self.read_token and self.api_key: params["api_key"] = self.api_key
-        response = requests.get(url, headers=self.headers, params=params, timeout=15)
+        response = self.session.get(url, headers=self.headers, params=params, timeout=15)
         response.raise_for_status()
         return [item['id'] for item in response.json().get('results', [])]
 
+    @profiled('tmdb: поиск')
     def search_movie(self, query, year=None):
         url = f"{self.BASE_URL}/search/movie"
         params = {"language": "ru-RU", "query": query, "page": 1}
         if year: params["primary_release_year"] = year
         if not self.read_token and self.api_key: params["api_key"] = self.api_key
-        response = requests.get(url, headers=self.headers, params=params, timeout=15)
+        response = self.session.get(url, headers=self.headers, params=params, timeout=15)
         response.raise_for_status()
         results = response.json().get("results", [])
         return results[0]['id'] if results else None
 
+    @profiled('tmdb: поиск')
     def search_tv(self, query, year=None):
         url = f"{self.BASE_URL}/search/tv"
         params = {"language": "ru-RU", "query": query, "page": 1}
         if year: params["first_air_date_year"] = year
         if not self.read_token and self.api_key: params["api_key"] = self.api_key
-        response = requests.get(url, headers=self.headers, params=params, timeout=15)
+        response = self.session.get(url, headers=self.headers, params=params, timeout=15)
         response.raise_for_status()
         results = response.json().get("results", [])
         return results[0]['id'] if results else None
@@ -1,22 +1,39 @@
-from flask import Flask, render_template, request, jsonify, abort
+from flask import Flask, render_template, request, jsonify, abort, g
 import sqlite3
 import math
 import os
 import json
-import subprocess
 import time
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+import delta_export
+from client_db import CLIENT_COLUMNS, CLIENT_SOURCES
+from database import MovieDatabase
+from job_manager import JobManager, progress_key
+import metrics
+import profiler
 
 app = Flask(__name__)
 DATA_DIR = 'data/'
 os.makedirs(DATA_DIR, exist_ok=True)
 DB_NAME = os.path.join(DATA_DIR, "movies.db")
+# Число потоков waitress, под него же рассчитан пул соединений к БД
+WEB_THREADS = 4
+# Сколько байт с конца лога читать для панели (хватает на последние 50 строк)
+LOG_TAIL_BYTES = 64 * 1024
+# Прогресс задач: по файлу на задачу (main.ProgressReporter)
+PROGRESS_DIR = os.path.join(DATA_DIR, 'progress')
+# Прогресс запуска из консоли (не задачи менеджера) считается брошенным, если не обновлялся столько секунд
+PROGRESS_STALE_SECONDS = 300
 
-# Глобальное состояние для процесса
-parser_process = None
+# Глобальное состояние для процесса. Менеджер задач и планировщик запускаются в __main__:
+# воркеры менеджера - отдельные процессы, и при их старте этот модуль импортируется заново.
+job_manager = None
 scheduler = BackgroundScheduler()
-scheduler.start()
 
 def get_parser_config():
     try:
@@ -30,14 +47,8 @@ def save_parser_config(data):
         json.dump(data, f)
         
 def start_parser_task(mode):
-    global parser_process
-    flag_path = os.path.join(DATA_DIR, 'stop.flag')
-    if parser_process is None or parser_process.poll() is not None:
-        if os.path.exists(flag_path):
-            try: os.remove(flag_path)
-            except OSError: pass
-        # Процесс не запущен или уже завершился
-        parser_process = subprocess.Popen(["python", "main.py", "--mode", mode])
+    """Ставит задачу парсера в очередь менеджера задач (независимые задачи выполняются параллельно)."""
+    return job_manager.submit(mode)
 
 def update_cron_job(cron_time_str):
     try:
@@ -46,37 +57,93 @@ def update_cron_job(cron_time_str):
     except Exception as e:
         print(f"Error updating cron: {e}")
 
-# Добавляем задачу при старте
-initial_config = get_parser_config()
-h, m = map(int, initial_config.get("cron_time", "02:00").split(':'))
-scheduler.add_job(id='parser_job', func=start_parser_task, args=['cron'], trigger=CronTrigger(hour=h, minute=m))
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Метка - шаблон маршрута, а не URL, чтобы число рядов не росло с каждым ID
+    endpoint = request.url_rule.rule if request.url_rule else 'unknown'
+    metrics.WEB_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    started_at = g.get('request_started_at')
+    if started_at is not None:
+        metrics.WEB_DURATION.observe(time.perf_counter() - started_at, endpoint=endpoint)
+    return response
 
 def make_searchable(text):
     if not text:
         return ""
     return str(text).lower().replace('ё', 'е')
 
+class ReadOnlyConnectionPool:
+    """
+    Пул соединений только для чтения: соединения открываются один раз и переиспользуются
+    потоками waitress, так что на запрос остается только сам SQL-запрос.
+    """
+
+    def __init__(self, db_path, size):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._init_lock = threading.Lock()
+
+    def _ensure_database(self):
+        """
+        mode=ro не создает файл: на свежей установке до первого запуска парсера базы еще нет.
+        Создаем пустую схему, чтобы страницы отдавали пустые списки, а не ошибку.
+        """
+        if os.path.exists(self.db_path):
+            return
+        with self._init_lock:
+            if not os.path.exists(self.db_path):
+                MovieDatabase(self.db_path)
+
+    def _connect(self):
+        self._ensure_database()
+        conn = sqlite3.connect(
+            f"file:{os.path.abspath(self.db_path)}?mode=ro", uri=True,
+            timeout=10, check_same_thread=False, cached_statements=256
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("PRAGMA mmap_size = 268435456")
+        conn.create_function("searchable", 1, make_searchable, deterministic=True)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                # Не держим открытую транзакцию чтения, иначе парсер не сможет записать
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put_nowait(conn)
+            except (sqlite3.Error, queue.Full):
+                conn.close()
+
+db_pool = ReadOnlyConnectionPool(DB_NAME, WEB_THREADS)
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    conn.create_function("searchable", 1, make_searchable)
-    return conn
+    return db_pool.connection()
 
 @app.route('/')
 def index():
     try:
-        conn = get_db_connection()
-        # Статистика: фильмы
-        movies_count = conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
-        # Статистика: раздачи
-        torrents_count = conn.execute("SELECT COUNT(*) FROM torrents").fetchone()[0]
-        # Фильмы без раздач
-        movies_without_torrents = conn.execute("""
-            SELECT COUNT(*) FROM movies 
-            WHERE id NOT IN (SELECT DISTINCT movie_id FROM torrents)
-        """).fetchone()[0]
-        now_playing_count = conn.execute("SELECT COUNT(*) FROM now_playing").fetchone()[0]
-        conn.close()
+        with get_db_connection() as conn:
+            # Статистика: фильмы
+            movies_count = conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+            # Статистика: раздачи
+            torrents_count = conn.execute("SELECT COUNT(*) FROM torrents").fetchone()[0]
+            # Фильмы без раздач
+            movies_without_torrents = conn.execute("SELECT COUNT(*) FROM movies WHERE torrent_count = 0").fetchone()[0]
+            now_playing_count = conn.execute("SELECT COUNT(*) FROM now_playing").fetchone()[0]
     except sqlite3.OperationalError:
         movies_count, torrents_count, movies_without_torrents, now_playing_count = 0, 0, 0, 0
 
@@ -88,57 +155,79 @@ def index():
         now_playing_count=now_playing_count
     )
 
+# Сортировки списка фильмов: (условие, ORDER BY). "seeds" - только фильмы с раздачами,
+# идет по частичному индексу idx_movies_seeds без обращения к torrents
+MOVIE_SORTS = {
+    'new': ("", "id DESC"),
+    'seeds': ("torrent_count > 0", "max_seeds DESC, id DESC"),
+}
+
 @app.route('/movies')
 def movies():
     search_query = request.args.get('q', '').strip()
+    sort = request.args.get('sort', 'new')
+    if sort not in MOVIE_SORTS:
+        sort = 'new'
+    genre_id = request.args.get('genre', type=int)
+    year = request.args.get('year', type=int)
+    min_rating = request.args.get('rating', type=float)
+    person = request.args.get('person', '').strip()
     page = request.args.get('page', 1, type=int)
     per_page = 20
     offset = (page - 1) * per_page
 
-    conn = get_db_connection()
-    
+    sort_condition, order_by = MOVIE_SORTS[sort]
+    conditions, params = [], []
+    if sort_condition:
+        conditions.append(sort_condition)
     if search_query:
         # Поиск по названию ИЛИ оригинальному названию
-        query_sql = """
-            SELECT * FROM movies 
-            WHERE searchable(title) LIKE ? OR searchable(original_title) LIKE ?
-            ORDER BY id DESC
-            LIMIT ? OFFSET ?
-        """
-        count_sql = "SELECT COUNT(*) FROM movies WHERE searchable(title) LIKE ? OR searchable(original_title) LIKE ?"
+        conditions.append("(searchable(title) LIKE ? OR searchable(original_title) LIKE ?)")
         like_term = f"%{make_searchable(search_query)}%"
-        
-        movies_list = conn.execute(query_sql, (like_term, like_term, per_page, offset)).fetchall()
-        total_movies = conn.execute(count_sql, (like_term, like_term)).fetchone()[0]
-    else:
-        query_sql = "SELECT * FROM movies ORDER BY id DESC LIMIT ? OFFSET ?"
-        count_sql = "SELECT COUNT(*) FROM movies"
-        movies_list = conn.execute(query_sql, (per_page, offset)).fetchall()
-        total_movies = conn.execute(count_sql).fetchone()[0]
+        params += [like_term, like_term]
+    # Фильтры идут по индексам справочников и movies, а не по LIKE над строками
+    if genre_id:
+        conditions.append("id IN (SELECT movie_id FROM movie_genres WHERE genre_id = ?)")
+        params.append(genre_id)
+    if year:
+        conditions.append("release_date >= ? AND release_date < ?")
+        params += [f"{year:04d}", f"{year + 1:04d}"]
+    if min_rating is not None:
+        conditions.append("rating >= ?")
+        params.append(min_rating)
+    if person:
+        conditions.append("id IN (SELECT mp.movie_id FROM people p JOIN movie_people mp ON mp.person_id = p.id WHERE p.name = ?)")
+        params.append(person)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
 
-    conn.close()
+    with get_db_connection() as conn:
+        movies_list = conn.execute(f"SELECT * FROM movies {where} ORDER BY {order_by} LIMIT ? OFFSET ?", (*params, per_page, offset)).fetchall()
+        total_movies = conn.execute(f"SELECT COUNT(*) FROM movies {where}", params).fetchone()[0]
+        genres = conn.execute("SELECT id, name FROM genres ORDER BY name").fetchall()
 
     total_pages = math.ceil(total_movies / per_page)
+    # Параметры списка без номера страницы - для ссылок пагинации
+    filters = {key: value for key, value in request.args.items() if key != 'page' and value}
     
     return render_template(
         'movies.html', 
         movies=movies_list, 
         search_query=search_query, 
+        sort=sort,
+        genres=genres,
+        filters=filters,
         page=page, 
         total_pages=total_pages
     )
 
 @app.route('/movie/<int:movie_id>')
 def movie_detail(movie_id):
-    conn = get_db_connection()
-    movie = conn.execute("SELECT * FROM movies WHERE id = ?", (movie_id,)).fetchone()
-    
-    if movie is None:
-        conn.close()
-        abort(404)
-        
-    torrents = conn.execute("SELECT * FROM torrents WHERE movie_id = ? ORDER BY size_gb DESC", (movie_id,)).fetchall()
-    conn.close()
+    with get_db_connection() as conn:
+        movie = conn.execute(f"SELECT * FROM {CLIENT_SOURCES['movies']} WHERE id = ?", (movie_id,)).fetchone()
+        if movie is None:
+            abort(404)
+        # Одинаковые раздачи с разных трекеров показываются одной строкой
+        torrents = conn.execute(f"SELECT * FROM {CLIENT_SOURCES['torrents']} WHERE movie_id = ? ORDER BY size_gb DESC", (movie_id,)).fetchall()
     
     return render_template('movie_detail.html', movie=movie, torrents=torrents)
 
@@ -148,8 +237,6 @@ def now_playing():
     per_page = 20
     offset = (page - 1) * per_page
 
-    conn = get_db_connection()
-    
     query_sql = """
         SELECT m.*, np.added_at 
         FROM now_playing np 
@@ -160,14 +247,13 @@ def now_playing():
     count_sql = "SELECT COUNT(*) FROM now_playing"
     
     try:
-        items_list = conn.execute(query_sql, (per_page, offset)).fetchall()
-        total_items = conn.execute(count_sql).fetchone()[0]
+        with get_db_connection() as conn:
+            items_list = conn.execute(query_sql, (per_page, offset)).fetchall()
+            total_items = conn.execute(count_sql).fetchone()[0]
     except sqlite3.OperationalError:
         items_list = []
         total_items = 0
 
-    conn.close()
-
     total_pages = math.ceil(total_items / per_page) if total_items > 0 else 0
     
     return render_template(
@@ -189,44 +275,227 @@ def download_db():
     except FileNotFoundError:
         return abort(404)
 
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+MOVIE_COLUMNS = ", ".join(CLIENT_COLUMNS['movies'])
+TORRENT_COLUMNS = ", ".join(CLIENT_COLUMNS['torrents'])
+
+class ResponseCache:
+    """Небольшой LRU-кеш сериализованных ответов API. Сбрасывается при смене версии БД."""
+
+    def __init__(self, max_items=256):
+        self.max_items = max_items
+        self.version = None
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self.version:
+                self._items.clear()
+                self.version = version
+                return None
+            body = self._items.get(key)
+            if body is not None:
+                self._items.move_to_end(key)
+            return body
+
+    def put(self, version, key, body):
+        with self._lock:
+            if version != self.version:
+                return
+            self._items[key] = body
+            if len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+api_cache = ResponseCache()
+
+def api_json_response(build):
+    """
+    Отдает JSON из build(conn) с ETag по версии БД (номер в журнале изменений - растет при каждой
+    записи в movies/torrents/now_playing). На If-None-Match с той же версией отвечает 304.
+    PRAGMA data_version не подходит: его значение свое у каждого соединения пула.
+    """
+    try:
+        with get_db_connection() as conn:
+            version = delta_export.get_db_version(conn)
+            etag = f"v{version}"
+            if request.if_none_match.contains(etag):
+                body = None
+            else:
+                key = request.full_path
+                body = api_cache.get(version, key)
+                if body is None:
+                    data = build(conn)
+                    if data is None:
+                        abort(404)
+                    body = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+                    api_cache.put(version, key, body)
+    except sqlite3.OperationalError:
+        return jsonify({"error": "База данных недоступна"}), 503
+
+    response = app.response_class(body or "", mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def get_api_limit():
+    return max(1, min(request.args.get('limit', API_PAGE_SIZE, type=int), API_MAX_PAGE_SIZE))
+
+@app.route('/api/movies')
+def api_movies():
+    """Список фильмов по убыванию ID, постранично по ключу: ?after_id=<последний id>&limit=&media_type="""
+    after_id = request.args.get('after_id', type=int)
+    media_type = request.args.get('media_type')
+    limit = get_api_limit()
+
+    def build(conn):
+        conditions, params = [], []
+        if after_id is not None:
+            conditions.append("id < ?")
+            params.append(after_id)
+        if media_type:
+            conditions.append("media_type = ?")
+            params.append(media_type)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = conn.execute(f"SELECT {MOVIE_COLUMNS} FROM {CLIENT_SOURCES['movies']} {where} ORDER BY id DESC LIMIT ?", (*params, limit)).fetchall()
+        items = [dict(row) for row in rows]
+        return {"items": items, "next_after_id": items[-1]["id"] if len(items) == limit else None}
+
+    return api_json_response(build)
+
+@app.route('/api/movie/<int:movie_id>')
+def api_movie(movie_id):
+    def build(conn):
+        movie = conn.execute(f"SELECT {MOVIE_COLUMNS} FROM {CLIENT_SOURCES['movies']} WHERE id = ?", (movie_id,)).fetchone()
+        if movie is None:
+            return None
+        torrents = conn.execute(
+            f"SELECT {TORRENT_COLUMNS} FROM {CLIENT_SOURCES['torrents']} WHERE movie_id = ? ORDER BY seeds DESC, size_gb DESC", (movie_id,)
+        ).fetchall()
+        return {**dict(movie), "torrents": [dict(row) for row in torrents]}
+
+    return api_json_response(build)
+
+@app.route('/api/now_playing')
+def api_now_playing():
+    """Сейчас в кино, от новых к старым: ?after=<next_after из прошлого ответа>&limit="""
+    after = request.args.get('after', '')
+    limit = get_api_limit()
+
+    def build(conn):
+        where, params = "", ()
+        added_at, _, after_id = after.rpartition('|')
+        if added_at and after_id.isdigit():
+            where, params = "WHERE (np.added_at, np.movie_id) < (?, ?)", (added_at, int(after_id))
+        rows = conn.execute(f"""
+            SELECT {", ".join('m.' + c for c in CLIENT_COLUMNS['movies'])}, np.added_at
+            FROM now_playing np JOIN {CLIENT_SOURCES['movies']} m ON np.movie_id = m.id
+            {where}
+            ORDER BY np.added_at DESC, np.movie_id DESC
+            LIMIT ?
+        """, (*params, limit)).fetchall()
+        items = [dict(row) for row in rows]
+        next_after = f"{items[-1]['added_at']}|{items[-1]['id']}" if len(items) == limit else None
+        return {"items": items, "next_after": next_after}
+
+    return api_json_response(build)
+
+@app.route('/profiles')
+def profiles():
+    """Сравнение последних запусков парсера с --profile."""
+    reports = profiler.load_reports(5)
+    span_names = []
+    for report in reports:
+        for item in report['spans']:
+            if item['name'] not in span_names:
+                span_names.append(item['name'])
+    spans_by_run = [{item['name']: item for item in report['spans']} for report in reports]
+    return render_template('profiles.html', reports=reports, span_names=span_names, spans_by_run=spans_by_run)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики веб-интерфейса и процессов парсера в текстовом формате Prometheus."""
+    return app.response_class(metrics.render(metrics.collect('web')), mimetype='text/plain; version=0.0.4')
+
+def read_progress(active_job_ids):
+    """
+    Сводит файлы прогресса работающих задач. Файл задачи, которой уже нет среди активных
+    (например, воркер упал), не учитывается. Одна задача - ее прогресс как есть; несколько -
+    общий счетчик по всем и прогресс каждой в sources.
+    """
+    entries = []
+    try:
+        names = sorted(os.listdir(PROGRESS_DIR))
+    except OSError:
+        return {}
+    now = time.time()
+    active_keys = {progress_key(job_id) for job_id in active_job_ids}
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        key = name[:-len('.json')]
+        try:
+            with open(os.path.join(PROGRESS_DIR, name), 'r', encoding='utf-8') as f:
+                prog = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if key in active_keys:
+            entries.append(prog)
+        elif not key.startswith(progress_key('')) and now - prog.get('timestamp', 0) < PROGRESS_STALE_SECONDS:
+            entries.append(prog)
+
+    if not entries:
+        return {}
+    if len(entries) == 1:
+        return entries[0]
+    merged = {
+        'task': "; ".join(prog['task'] for prog in entries),
+        'current': sum(prog['current'] for prog in entries),
+        'total': sum(prog['total'] for prog in entries),
+        'rate': None, 'eta': None, 'sources': {},
+    }
+    for prog in entries:
+        sources = prog.get('sources') or {
+            prog.get('label') or prog.get('job'): {field: prog.get(field) for field in ('task', 'current', 'total', 'rate', 'eta')}
+        }
+        merged['sources'].update(sources)
+    return merged
+
 @app.route('/api/status')
 def api_status():
-    global parser_process
-    
-    is_running = parser_process is not None and parser_process.poll() is None
-    is_stopping = os.path.exists(os.path.join(DATA_DIR, 'stop.flag'))
-    status = {'task': 'Idle', 'current': 0, 'total': 0, 'logs': [], 'is_running': is_running, 'is_stopping': is_stopping}
+    status = {
+        'task': 'Idle', 'current': 0, 'total': 0, 'logs': [],
+        'is_running': job_manager.is_busy(), 'is_stopping': job_manager.is_stopping(),
+        'jobs': job_manager.snapshot()
+    }
     
     # Считывание статистики БД
     try:
-        conn = get_db_connection()
-        status['movies_count'] = conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
-        status['torrents_count'] = conn.execute("SELECT COUNT(*) FROM torrents").fetchone()[0]
-        status['movies_without_torrents'] = conn.execute("SELECT COUNT(*) FROM movies WHERE id NOT IN (SELECT DISTINCT movie_id FROM torrents)").fetchone()[0]
-        status['now_playing_count'] = conn.execute("SELECT COUNT(*) FROM now_playing").fetchone()[0]
-        conn.close()
+        with get_db_connection() as conn:
+            status['movies_count'] = conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+            status['torrents_count'] = conn.execute("SELECT COUNT(*) FROM torrents").fetchone()[0]
+            status['movies_without_torrents'] = conn.execute("SELECT COUNT(*) FROM movies WHERE torrent_count = 0").fetchone()[0]
+            status['now_playing_count'] = conn.execute("SELECT COUNT(*) FROM now_playing").fetchone()[0]
     except:
         status['movies_count'] = 0
         status['torrents_count'] = 0
         status['movies_without_torrents'] = 0
         status['now_playing_count'] = 0
         
-    # Считывание прогресса
-    try:
-        progress_path = os.path.join(DATA_DIR, 'progress.json')
-        if os.path.exists(progress_path):
-            with open(progress_path, 'r', encoding='utf-8') as f:
-                prog = json.load(f)
-                status.update(prog)
-    except:
-        pass
+    # Считывание прогресса: файлы работающих задач сводятся в одно состояние
+    active_ids = {job['id'] for job in status['jobs']['active']}
+    status.update(read_progress(active_ids))
         
     # Считывание логов
     try:
         log_path = os.path.join(DATA_DIR, 'parser.log')
         if os.path.exists(log_path):
-            with open(log_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            # Лог больше не очищается при запуске, поэтому читаем только его хвост
+            with open(log_path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - LOG_TAIL_BYTES))
+                lines = f.read().decode('utf-8', errors='replace').splitlines()
                 # Берем последние 50 строк лога
                 status['logs'] = [line.strip() for line in lines[-50:]]
     except:
@@ -247,7 +516,6 @@ def api_config():
 
 @app.route('/api/action', methods=['POST'])
 def api_action():
-    global parser_process
     action = request.json.get('action')
     
     if action == 'start_tmdb':
@@ -262,17 +530,15 @@ def api_action():
     elif action == 'start_nnmclub':
         start_parser_task('nnmclub')
         return jsonify({"status": "started"})
+    elif action == 'start_seeds':
+        start_parser_task('seeds')
+        return jsonify({"status": "started"})
     elif action == 'stop':
-        # БЕЗУСЛОВНО создаем флаг остановки, даже если процесс - "сирота"
-        with open(os.path.join(DATA_DIR, 'stop.flag'), 'w') as f:
-            f.write('stop')
-            
-        # Если мы все еще отслеживаем процесс - можем попытаться его мягко завершить
-        if parser_process is not None and parser_process.poll() is None:
-            pass # Процесс сам завершится, прочитав stop.flag
-            
+        # Отменяем ожидающие задачи и сигналим выполняющимся через события воркеров
+        job_manager.cancel_all()
         return jsonify({"status": "stopping"})
     elif action == 'clear_lock':
+        # Флаг остановки остался только для запусков main.py из консоли
         flag_path = os.path.join(DATA_DIR, 'stop.flag')
         if os.path.exists(flag_path):
             try: os.remove(flag_path)
@@ -283,23 +549,14 @@ def api_action():
 
 @app.route('/api/shutdown', methods=['POST'])
 def api_shutdown():
-    global parser_process
-    
-    # 1. Создаем флаг остановки для любых зависших фоновых скриптов
-    with open(os.path.join(DATA_DIR, 'stop.flag'), 'w') as f:
-        f.write('stop')
-        
-    # 2. Принудительно убиваем отслеживаемый процесс, если он жив
-    if parser_process is not None and parser_process.poll() is None:
-        try:
-            parser_process.terminate()
-        except:
-            pass
-            
-    # 3. Убиваем сам веб-сервер через 1 секунду (чтобы успеть отдать ответ)
-    import threading
+    # 1. Отменяем задачи и останавливаем воркеры (зависшие завершаем принудительно),
+    # 2. затем убиваем сам веб-сервер (через секунду, чтобы успеть отдать ответ)
     def kill_process():
         time.sleep(1)
+        try:
+            job_manager.shutdown()
+        except Exception:
+            pass
         os._exit(0)
     threading.Thread(target=kill_process, daemon=True).start()
     
@@ -307,5 +564,10 @@ def api_shutdown():
 
 if __name__ == '__main__':
     from waitress import serve
+    job_manager = JobManager()
+    scheduler.start()
+    initial_config = get_parser_config()
+    h, m = map(int, initial_config.get("cron_time", "02:00").split(':'))
+    scheduler.add_job(id='parser_job', func=start_parser_task, args=['cron'], trigger=CronTrigger(hour=h, minute=m))
     print("Запуск production-сервера Waitress на порту 5000...")
-    serve(app, host='0.0.0.0', port=5000, threads=4)
+    serve(app, host='0.0.0.0', port=5000, threads=WEB_THREADS)